@@ -1,17 +1,40 @@
 import argparse
+import copy
 import os
-import json
+import nibabel as nib
 import numpy as np
-from tqdm import tqdm 
 from pathlib import Path
-from simulator import ArtifactSimulator
-from gif_visualizer import save_gif
-from param import Opts
+from simulator import ArtifactSimulator, COMPUTE_DTYPES
+from gif_visualizer import save_gif, GifWriter
+from param import Opts, get_simulations
+from results_io import ResultsWriter
+from shard_store import SHARD_LAYOUTS, ShardWriter
+from targets_store import TargetsWriter
+from volume_cache import VolumeCache
+from profiler import PROFILER
+from manifest import RunManifest
+from pipeline import MemoryBudget, Stage, run_pipeline
+from seeding import PARAM_STREAM, new_run_seed, seed_record, task_rng
+from sharding import parse_shard, partition_files, write_shard_info
+from sweep import SWEEP_METHODS, apply_config, group_tasks, load_plan, plan_sweep, save_plan, sweep_configs
 
 
 class RunCLI:
+    # Execution settings taken from the command line even when parameters come from param.py
+    run_settings = ('workers', 'lazy', 'json_file', 'targets_format', 'variants', 'jpeg_snippet', 'profile', 'trace_file', 'seed',
+                    'resume', 'manifest', 'hash_inputs', 'cache_dir', 'cache_size',
+                    'keep_dtype', 'compression_level', 'io_threads', 'out_of_core', 'memory_budget', 'per_timepoint',
+                    'compute_dtype', 'shard_size', 'shard_layout',
+                    'sweep', 'sweep_samples', 'sweep_levels', 'plan_file', 'run_plan', 'shard',
+                    'pipeline', 'stage_workers', 'queue_size', 'pipeline_memory')
+
     def __init__(self):
         self.parser = self._create_parser()
+        self.cli_args = None    # command line, parsed once per run
+        self.range_opts = None  # param.py settings, resampled per file in range mode
+        self.run_seed = None    # seed every file's random streams are derived from
+        self.gif_writer = None  # background GIF encoder while a run is in progress
+        self.shard_writer = None  # open shard dataset with --save_type shards
         
         
     def int_or_float(self, value):
@@ -20,10 +43,27 @@ class RunCLI:
         except ValueError:
             return float(value)
         
-    def get_fixed_range(self):
-        args = self.parser.parse_args()
+    def get_fixed_range(self, file_path=None):
+        """
+        Resolve the settings for the run, or for `file_path` when given.
+
+        The command line is parsed and param.Opts built only on the first call; in range
+        mode the random parameters of each file are redrawn on a copy of those settings,
+        from that file's parameter stream of the run seed.
+        """
+        if self.cli_args is None:
+            self.cli_args = self.parser.parse_args()
+            self.run_seed = self.cli_args.seed if self.cli_args.seed is not None else new_run_seed()
+        args = self.cli_args
         if args.fixed_range == 'range':
-            opt = Opts()
+            if self.range_opts is None:
+                self.range_opts = Opts(rng=np.random.default_rng(self.run_seed))
+                for name in self.run_settings:
+                    setattr(self.range_opts, name, getattr(args, name))
+            if file_path is None:
+                return self.range_opts
+            opt = copy.copy(self.range_opts)
+            opt.resample(task_rng(self.run_seed, file_path, PARAM_STREAM))
             args = opt
         elif args.fixed_range == 'fixed':  # fixed
             args = args
@@ -40,7 +80,7 @@ class RunCLI:
         parser.add_argument("--i", type=str, default="../Sample_Data/", required=False,  help="Directory with NIfTI files")
         parser.add_argument("--o", type=str, default="../outputs/", help="Directory for outputs and JSON if not specified")
         parser.add_argument("--gif_dir", type=str, default="../outputs/gifs/", help="Directory for GIFs")
-        parser.add_argument("--json_file", type=str, default=None, help="JSON output file (default: <o>/analysis_results.json)")
+        parser.add_argument("--json_file", type=str, default=None, help="JSON Lines results file (default: <o>/multi_analysis_results.jsonl or <o>/<file>_<sim_types>.jsonl)")
         parser.add_argument("--sim_img", type=str, choices=["single_img", "multi_img"], default="single_img", required=False, help="Number simulation image (single_img: 1, multi_img: 2+)")
         parser.add_argument("--sim_mode", type=str, choices=["single", "independent", "chained"], default="single", required=False, help="Simulation mode (single: 1, independent/chained: 2+)")
         parser.add_argument("--sim_type", type=str, nargs="+", choices=["missing_slides", "wrong_sequence", "mixed_axis"], required=False, help="Simulation types")
@@ -52,10 +92,42 @@ class RunCLI:
         parser.add_argument("--mixed_axis_list", type=int, nargs="+", default=[0, 1, 2], help="Axes for mixed_axis (e.g., 0 1 2)")
 
         parser.add_argument("--axis", type=int, choices=[0, 1, 2], default=0, help="Main axis for simulations")
+        parser.add_argument("--per_timepoint", action="store_true", default=False, help="On 4D series draw each timepoint's artifact independently instead of applying one draw to all timepoints")
         parser.add_argument("--clear_state", action="store_true", help="Clear simulator state before each file")
         parser.add_argument("--verbose", action="store_true", default=False, help="print out check points")
-        parser.add_argument("--save_type", type=str, choices=["3d", "jpeg", "None"], default="None", help="Output save type")
+        parser.add_argument("--save_type", type=str, choices=["3d", "jpeg", "shards", "None"], default="None", help="Output save type (shards: pack outputs and targets into <o>/shards)")
+        parser.add_argument("--keep_dtype", action="store_true", default=False, help="Save 3d outputs in the source's on-disk dtype and scaling instead of the --compute_dtype they were simulated in")
+        parser.add_argument("--compute_dtype", type=str, choices=COMPUTE_DTYPES, default="float64", help="Dtype volumes are decoded, simulated and saved in (native: the on-disk dtype; mixed_axis resamples in float32 unless float64)")
+        parser.add_argument("--shard_size", type=float, default=1024, help="MB per shard file with --save_type shards")
+        parser.add_argument("--shard_layout", type=str, choices=SHARD_LAYOUTS, default="volume", help="Store whole volumes or volumes split into contiguous 2D slices along --axis with --save_type shards")
+        parser.add_argument("--compression_level", type=int, choices=range(10), default=1, help="Gzip level of 3d outputs (0: write uncompressed .nii)")
+        parser.add_argument("--io_threads", type=int, default=None, help="Threads used for gzip and JPEG encoding of outputs (default: one per CPU)")
+        parser.add_argument("--out_of_core", action="store_true", default=False, help="Write each simulated volume slab by slab into an uncompressed <o>/<name>.nii instead of building it in memory")
+        parser.add_argument("--memory_budget", type=float, default=256, help="MB of slices held at once with --out_of_core")
+        parser.add_argument("--jpeg_snippet", action="store_true", default=False, help="Also write a 2x6 snippet.jpg montage with --save_type jpeg")
         parser.add_argument("--fixed_range", type=str, choices=["fixed", "range"], default="range", required=True, help="fixed value for simualtion or provide range in param.py")
+        parser.add_argument("--workers", type=int, default=1, help="Number of worker processes for multi_img runs (1: run in this process)")
+        parser.add_argument("--targets_format", type=str, choices=["json", "binary", "seed"], default="json", help="Store target arrays in the JSON results (json), in a compact binary file next to them (binary) or not at all, replaying them from the entry's seed (seed)")
+        parser.add_argument("--cache_dir", type=str, default=None, help="Directory of the persistent decoded-volume cache (default: no cache)")
+        parser.add_argument("--cache_size", type=float, default=20, help="Size cap of the decoded-volume cache in GB; least recently used volumes are evicted")
+        parser.add_argument("--resume", action="store_true", default=False, help="Skip files the run manifest records as done with the same input and settings")
+        parser.add_argument("--manifest", type=str, default=None, help="Run manifest of completed multi_img files (default: <o>/run_manifest.jsonl)")
+        parser.add_argument("--hash_inputs", action="store_true", default=False, help="Identify inputs by content hash instead of path, size and mtime in the run manifest")
+        parser.add_argument("--seed", type=int, default=None, help="Run seed every file's random streams are derived from (default: a fresh random seed, recorded in the results)")
+        parser.add_argument("--variants", type=int, default=1, help="Number of independent simulated variants generated per loaded file")
+        parser.add_argument("--lazy", action="store_true", default=False, help="Lazily load volumes (memory-map .nii files, read slices on demand)")
+        parser.add_argument("--pipeline", action="store_true", default=False, help="Run multi_img files through overlapping load, simulate, preview and write stages on threads")
+        parser.add_argument("--stage_workers", type=int, nargs=4, default=[1, 1, 1, 1], metavar=("LOAD", "SIMULATE", "PREVIEW", "WRITE"), help="Threads per --pipeline stage")
+        parser.add_argument("--queue_size", type=int, default=2, help="Files waiting between two --pipeline stages")
+        parser.add_argument("--pipeline_memory", type=float, default=4096, help="MB of decoded volumes and outputs --pipeline keeps in flight before it stops loading")
+        parser.add_argument("--shard", type=parse_shard, default=None, help="Process only shard i of N (e.g. 0/4) of a multi_img run; inputs are split by file size, identically on every node")
+        parser.add_argument("--sweep", type=str, choices=SWEEP_METHODS, default=None, help="Plan a parameter sweep over the param.py ranges (grid, Latin hypercube or stratified) and run it")
+        parser.add_argument("--sweep_samples", type=int, default=16, help="Configs drawn by an lhs sweep, or per axis combination by a stratified sweep")
+        parser.add_argument("--sweep_levels", type=int, default=3, help="Values per parameter range of a grid sweep")
+        parser.add_argument("--plan_file", type=str, default=None, help="Where the sweep plan is saved (default: <o>/sweep_plan.jsonl)")
+        parser.add_argument("--run_plan", type=str, default=None, help="Run the tasks of a saved sweep plan instead of planning one")
+        parser.add_argument("--profile", action="store_true", default=False, help="Time every pipeline stage, add per-file stage times to the results and print a summary")
+        parser.add_argument("--trace_file", type=str, default=None, help="Chrome trace JSON written with --profile (default: <o>/profile_trace.json)")
         return parser
     
     def SetUp(self, args):
@@ -79,6 +151,11 @@ class RunCLI:
             if len(args.mixed_axis_list) == 1 or len(args.mixed_axis_list) > 3:
                 print("Error: mixed_axis_list must contain 1 to 3 integers (0, 1, or 2)")
                 return
+
+        # Worker processes cannot share the shard writer
+        if args.save_type == "shards" and args.workers > 1 and not args.pipeline and not args.sweep:
+            print("Error: --save_type shards needs --workers 1 or --pipeline")
+            return False
             
         print(args.gif_dir)
         # Ensure directories exist
@@ -89,209 +166,514 @@ class RunCLI:
         
     
         
-    def np_encoder(self, obj):
-        if isinstance(obj, np.int64):
-            return int(obj)
-        return obj
+    def open_cache(self, args):
+        """Open the decoded-volume cache of `--cache_dir`, or return None when caching is off."""
+        if not args.cache_dir:
+            return None
+        return VolumeCache(args.cache_dir, max_bytes=int(args.cache_size * 2 ** 30))
 
+    def open_targets(self, args, json_path):
+        """Open the binary targets file that goes with `json_path`, or return None for JSON targets."""
+        if args.targets_format != "binary":
+            return None
+        return TargetsWriter(os.path.splitext(json_path)[0] + "_targets.bin")
 
-    def write_to_json(self, json_path, analysis_results):
-        # Check if the file exists and read existing data
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = []  # If file is empty or corrupted, initialize as empty list
-        else:
-            existing_data = []
+    def open_shards(self, args):
+        """Open the shard dataset `<o>/shards` for --save_type shards, or return None."""
+        if args.save_type != "shards":
+            return None
+        return ShardWriter(os.path.join(args.o, "shards"), int(args.shard_size * 2 ** 20), args.shard_layout)
 
-        # Append new results to the existing data
-        existing_data.append(self.np_encoder(analysis_results))
+    def close_shards(self):
+        if self.shard_writer is not None:
+            self.shard_writer.close()
+            self.shard_writer = None
 
-        # Write updated data back to file
-        with open(json_path, 'w') as f:
-            json.dump(self.np_encoder(existing_data), f) # Removed indent=4
+    def write_entry(self, writer, entry, targets_writer=None, drop_arrays=False):
+        """
+        Write one result entry.
 
-        print(f"Analysis results saved to {json_path}")
+        With a targets writer, array targets go to the binary targets file and the entry
+        keeps only scalar targets plus a `targets_ref` pointer to its record. With
+        `drop_arrays` the array targets are left out; `seeding.replay_entry` rebuilds them.
+        """
+        if drop_arrays:
+            entry = dict(entry)
+            entry["targets"] = {k: v for k, v in entry["targets"].items() if not isinstance(v, np.ndarray)}
+        elif targets_writer is not None:
+            targets = entry["targets"]
+            arrays = {k: v for k, v in targets.items() if isinstance(v, np.ndarray)}
+            entry = dict(entry)
+            entry["targets"] = {k: v for k, v in targets.items() if k not in arrays}
+            entry["targets_ref"] = targets_writer.write(arrays)
+        with PROFILER.stage("write_results"):
+            writer.write(entry)
 
-        
-    
     def get_SimType(self, args):
         # args = self.parser.parse_args()
         # Configure simulations based on sim_type
-        sim_configs = {}
-        if "missing_slides" in args.sim_type:
-            sim_configs["missing_slides"] = {'type': 'missing_slides', 'remove_param': args.remove_param, 'axis': args.axis}
-        if "wrong_sequence" in args.sim_type:
-            sim_configs["wrong_sequence"] = {'type': 'wrong_sequence', 'shuffle_param': args.shuffle_param, 'axis': args.axis}
-        if "mixed_axis" in args.sim_type:
-            sim_configs["mixed_axis"] = {'type': 'mixed_axis', 'axis_list': args.mixed_axis_list, 'weight_param': args.weight_param}
+        return get_simulations(args)
     
-        selected_sims = [sim_configs[sim_type] for sim_type in args.sim_type]
-        
-        return selected_sims
-    
-    def SimOps(self, simulator, base_name, args):
+    def SimOps(self, simulator, base_name, args, file_path=None, tag=""):
+        """
+        Run the configured simulations on one loaded file and return one result entry per simulation.
+
+        The simulations draw from `file_path`'s stream of the run seed, recorded in each entry's `seed`.
+        `tag` is appended to output names (e.g. the task of a sweep).
+        """
+        return [self.SaveOps(simulator, data, entry, output_name, label, args)
+                for data, entry, output_name, label in self.SimEntries(simulator, base_name, args, file_path, tag)]
 
+    def SimEntries(self, simulator, base_name, args, file_path=None, tag=""):
+        """Simulate one loaded file, yielding `(data, entry, output_name, label)` for every output, unsaved."""
         selected_sims = self.get_SimType(args)
+        file_path = file_path or base_name
+        rng = task_rng(self.run_seed, file_path)
         
-        analysis_results = None
-        
-        if args.sim_mode == "single":
-            data, targets = simulator.simulate(selected_sims, mode="single")
-            sim_type = args.sim_type[0]
-            gif_name = os.path.join(args.gif_dir, f"{base_name}_{sim_type}") #../gifs args.gif_dir
-            save_gif(data, gif_name, axis=args.axis)
-        
-            entry = {
-                "file_name": base_name,
-                "simulation_mode": "single",
-                "simulation_type": sim_type,
-                "parameters": {k: v for k, v in selected_sims[0].items() if k != 'type'},
-                "targets": {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in targets.items()},
-                "output_shape": list(data.shape),
-                "fixed_range": args.fixed_range
-            }
-            analysis_results = entry
-        
-            if args.save_type != "None":
-                output_path = os.path.join(args.o, f"{base_name}_{sim_type}")
-                if args.save_type == "3d":
-                    output_path += ".nii.gz"
-                simulator.save_data(data, args.save_type, args.axis, output_path)
-                entry["output_path"] = output_path
-                
-            if args.verbose:
-                print(f"Processed {sim_type}: Shape {data.shape}, GIF saved to {gif_name}")
-    
-        elif args.sim_mode == "independent":
-            results = simulator.simulate(selected_sims, mode="independent")
-            for (data, targets), sim in zip(results, selected_sims):
-                sim_type = sim['type']
-                gif_name = os.path.join(args.gif_dir, f"{base_name}_{sim_type}.gif")
-                save_gif(data, gif_name, axis=args.axis)
-            
-                entry = {
+        if args.per_timepoint and (args.variants > 1 or args.out_of_core):
+            raise ValueError("--per_timepoint cannot be combined with --variants or --out_of_core")
+
+        if args.out_of_core:
+            outputs = self.OutOfCoreOps(simulator, selected_sims, base_name, args, rng, tag)
+        elif args.variants > 1:
+            outputs = simulator.simulate_variants(selected_sims, args.variants, mode=args.sim_mode, rng=rng)
+        else:
+            # A generator, so the simulation runs inside the timed iteration below
+            # Preview-only runs keep volumes lazy: the GIF gathers just the slices it shows
+            lazy_output = args.save_type == "None" and not args.per_timepoint
+            outputs = (simulator.simulate(selected_sims, mode=args.sim_mode, rng=rng, per_timepoint=args.per_timepoint,
+                                          lazy_output=lazy_output)
+                       for _ in range(1))
+        outputs = PROFILER.iterate("simulate", outputs)
+
+        for variant, output in enumerate(outputs):
+            suffix = tag + (f"_v{variant}" if args.variants > 1 else "")
+
+            if args.sim_mode == "chained":
+                chained_data, chained_targets = output
+                chained_entry = {
                     "file_name": base_name,
-                    "simulation_mode": "independent",
-                    "simulation_type": sim_type,
-                    "parameters": {k: v for k, v in sim.items() if k != 'type'},
-                    "targets": {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in targets.items()},
-                    "output_shape": list(data.shape),
-                    "fixed_range": args.fixed_range
+                    "simulation_mode": "chained",
+                    "simulation_types": args.sim_type,
+                    "parameters": [{k: v for k, v in sim.items() if k != 'type'} for sim in selected_sims],
+                    "targets": chained_targets,
+                    "output_shape": list(chained_data.shape),
+                    "fixed_range": args.fixed_range,
+                    "seed": seed_record(self.run_seed, file_path, args.variants, compute_dtype=args.compute_dtype)
                 }
-                analysis_results = entry
-            
-                if args.save_type != "None":
-                    output_path = os.path.join(args.o, f"{base_name}_{sim_type}")
-                    if args.save_type == "3d":
-                        output_path += ".nii.gz"
-                    simulator.save_data(data, args.save_type, args.axis, output_path)
-                    entry["output_path"] = output_path
-                    
-                if args.verbose:
-                    print(f"Processed {sim_type}: Shape {data.shape}, GIF saved to {gif_name}")
-    
-        else:  # Chained mode
-            chained_data, chained_targets = simulator.simulate(selected_sims, mode="chained")
-            chained_gif_name = os.path.join(args.gif_dir, f"{base_name}_chained_{'_'.join(args.sim_type)}.gif")
-            save_gif(chained_data, chained_gif_name, axis=args.axis)
-        
-            chained_entry = {
-                "file_name": base_name,
-                "simulation_mode": "chained",
-                "simulation_types": args.sim_type,
-                "parameters": [{k: v for k, v in sim.items() if k != 'type'} for sim in selected_sims],
-                "targets": {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in chained_targets.items()},
-                "output_shape": list(chained_data.shape),
-                "fixed_range": args.fixed_range
-            }
-            analysis_results = chained_entry
-        
-            if args.save_type != "None":
-                chained_output_path = os.path.join(args.o, f"{base_name}_chained_{'_'.join(args.sim_type)}")
-                if args.save_type == "3d":
-                    chained_output_path += ".nii.gz"
-                simulator.save_data(chained_data, args.save_type, args.axis, chained_output_path)
-                chained_entry["output_path"] = chained_output_path
-                
-            if args.verbose:
-                print(f"Processed chained ({', '.join(args.sim_type)}): Shape {chained_data.shape}, GIF saved to {chained_gif_name}")
-            
-        return analysis_results     
+                if args.variants > 1:
+                    chained_entry["variant"] = variant
+                output_name = f"{base_name}_chained_{'_'.join(args.sim_type)}{suffix}"
+                label = f"chained ({', '.join(args.sim_type)})"
+                yield chained_data, chained_entry, output_name, label
+            else:
+                results = [output] if args.sim_mode == "single" else output
+                for index, ((data, targets), sim) in enumerate(zip(results, selected_sims)):
+                    sim_type = sim['type']
+                    entry = {
+                        "file_name": base_name,
+                        "simulation_mode": args.sim_mode,
+                        "simulation_type": sim_type,
+                        "parameters": {k: v for k, v in sim.items() if k != 'type'},
+                        "targets": targets,
+                        "output_shape": list(data.shape),
+                        "fixed_range": args.fixed_range,
+                        "seed": seed_record(self.run_seed, file_path, args.variants,
+                                            index if args.sim_mode == "independent" else None, args.per_timepoint,
+                                            args.compute_dtype)
+                    }
+                    if args.variants > 1:
+                        entry["variant"] = variant
+                    output_name = f"{base_name}_{sim_type}{suffix}"
+                    yield data, entry, output_name, sim_type
+
+    def OutOfCoreOps(self, simulator, selected_sims, base_name, args, rng, tag=""):
+        """
+        Run the simulations straight into uncompressed `<o>/<output_name>.nii` files.
+
+        Yields the single output like the in-memory path, with memmaps in place of arrays.
+        """
+        if args.variants > 1:
+            raise ValueError("--out_of_core does not support --variants")
+        os.makedirs(args.o, exist_ok=True)
+        if args.sim_mode == "chained":
+            output_path = os.path.join(args.o, f"{base_name}_chained_{'_'.join(args.sim_type)}{tag}.nii")
+        else:
+            output_path = [os.path.join(args.o, f"{base_name}_{sim['type']}{tag}.nii") for sim in selected_sims]
+            if args.sim_mode == "single":
+                output_path = output_path[0]
+        yield simulator.simulate_out_of_core(selected_sims, output_path, mode=args.sim_mode,
+                                             memory_budget=int(args.memory_budget * 2 ** 20), rng=rng)
+
+    def SaveOps(self, simulator, data, entry, output_name, label, args):
+        """Write the GIF preview and the optional simulated volume of one result entry."""
+        gif_name = self.PreviewOps(data, output_name, args)
+        self.WriteOps(simulator, data, entry, output_name, args)
+        if args.verbose:
+            print(f"Processed {label}: Shape {data.shape}, GIF saved to {gif_name}")
+        return entry
+
+    def PreviewOps(self, data, output_name, args):
+        """Write the GIF preview of one output, handed to `self.gif_writer` when one is running."""
+        gif_name = os.path.join(args.gif_dir, f"{output_name}.gif")
+        with PROFILER.stage("gif"):
+            save_gif(data, gif_name, axis=args.axis, writer=self.gif_writer)
+        return gif_name
+
+    def WriteOps(self, simulator, data, entry, output_name, args):
+        """Write the simulated volume of one output per --save_type and record its `output_path`."""
+        if args.out_of_core:
+            entry["output_path"] = data.filename  # already written while simulating
+        elif args.save_type == "shards":
+            if self.shard_writer is None:
+                raise ValueError("--save_type shards needs --workers 1 or --pipeline")
+            meta = {k: v for k, v in entry.items() if k != "targets"}
+            meta["output_name"] = output_name
+            with PROFILER.stage("write_shards"):
+                entry["shard_ref"] = self.shard_writer.write(data, entry["targets"], meta, args.axis)
+        elif args.save_type != "None":
+            output_path = os.path.join(args.o, output_name)
+            if args.save_type == "3d":
+                output_path += ".nii.gz" if args.compression_level > 0 else ".nii"
+            with PROFILER.stage(f"write_{args.save_type}"):
+                simulator.save_data(data, args.save_type, args.axis, output_path, snippet=args.jpeg_snippet,
+                                    threads=args.io_threads, keep_dtype=args.keep_dtype,
+                                    compresslevel=args.compression_level)
+            entry["output_path"] = output_path
+        return entry
         
     
+    def ProcessFile(self, file_path, args):
+        """
+        Load one NIfTI file, run the configured simulations and return its result entries.
+
+        With --profile every entry gets the file's `stage_times` in seconds.
+        """
+        mark = PROFILER.mark()
+        simulator = ArtifactSimulator(file_path, lazy=args.lazy, cache=self.open_cache(args),
+                                      compute_dtype=args.compute_dtype)
+        if args.clear_state:
+            simulator.clear_state()
+
+        base_name = os.path.splitext(os.path.splitext(os.path.basename(file_path))[0])[0]
+        if args.verbose:
+            print(f"Processing {os.path.basename(file_path)} in {args.sim_mode} mode with simulations: {args.sim_type}...")
+
+        entries = self.SimOps(simulator, base_name, args, file_path)
+        if PROFILER.enabled:
+            stage_times = PROFILER.stage_times(mark)
+            for entry in entries:
+                entry["stage_times"] = stage_times
+        return entries
+
     def MultiFile(self, args):
-        _ = self.SetUp(args)
-        json_paths = os.path.join(args.o, "multi_analysis_results.json")  
+        if self.SetUp(args) is False:
+            return
+        json_paths = args.json_file or os.path.join(args.o, "multi_analysis_results.jsonl")
         
         print(json_paths)
         
-        # Get image paths
-        nifti_files = [f for f in os.listdir(args.i) if f.endswith(('.nii', '.nii.gz'))]
+        # Get image paths (sorted so results are collected in a stable order)
+        nifti_files = sorted(f for f in os.listdir(args.i) if f.endswith(('.nii', '.nii.gz')))
         if not nifti_files:
             print(f"No NIfTI files found in {args.i}")
             return
     
-        analysis_results = []
         # print(args.sim_type) 
         print('remove_param_arg', args.remove_param)
-        
-    
-        for nifti_file in tqdm(nifti_files, desc="Simulating MRI files"):
-            file_path = os.path.join(args.i, nifti_file)
-            base_name = os.path.splitext(os.path.splitext(nifti_file)[0])[0]
-            reset_args = self.get_fixed_range() #Re
-            # print(reset_args.sim_type)
-            print('remove_param_reset_args', reset_args.remove_param)
-
-            simulator = ArtifactSimulator(file_path)
-            if reset_args.clear_state:
-                simulator.clear_state()
-                
-            if args.verbose:
-                print(f"Processing {nifti_file} in {reset_args.sim_mode} mode with simulations: {reset_args.sim_type}...")
-                
-            multi_analysis_results = self.SimOps(simulator, base_name, reset_args)
-            
-            analysis_results.append(multi_analysis_results)
-            
-        self.write_to_json(json_paths, analysis_results)
+
+        manifest = RunManifest(args.manifest or os.path.join(args.o, "run_manifest.jsonl"))
+        if args.resume and self.cli_args.seed is None and manifest.run_seed is not None:
+            self.run_seed = manifest.run_seed  # keep drawing the streams of the run being resumed
+            print(f"Resuming with run seed: {self.run_seed}")
+
+        file_paths = [os.path.join(args.i, nifti_file) for nifti_file in nifti_files]
+        if args.shard is not None:
+            index, count = args.shard
+            shard_paths = partition_files(file_paths, count)[index]
+            write_shard_info(args.o, index, count, file_paths, shard_paths, self.run_seed, json_paths, manifest.path, args.gif_dir)
+            print(f"Shard {index}/{count}: {len(shard_paths)} of {len(file_paths)} files")
+            file_paths = shard_paths
+
+        tasks = []
+        for file_path in file_paths:
+            reset_args = self.get_fixed_range(file_path) #Re
+            key = manifest.task_key(file_path, reset_args, self.run_seed, args.hash_inputs)
+            if args.resume and key in manifest:
+                continue
+            tasks.append((file_path, reset_args, key))
+        if args.resume:
+            print(f"Skipping {len(file_paths) - len(tasks)} of {len(file_paths)} files already in {manifest.path}")
+
+        targets_writer = self.open_targets(args, json_paths)
+        self.shard_writer = self.open_shards(args)
+        with ResultsWriter(json_paths) as writer, manifest:
+            if args.pipeline:
+                self.MultiFilePipeline(args, tasks, writer, targets_writer, manifest)
+            elif args.workers > 1:
+                self.MultiFileParallel(args, tasks, writer, targets_writer, manifest)
+            else:
+                from tqdm import tqdm
+                with GifWriter() as self.gif_writer:
+                    for file_path, reset_args, key in tqdm(tasks, desc="Simulating MRI files"):
+                        # print(reset_args.sim_type)
+                        print('remove_param_reset_args', reset_args.remove_param)
+
+                        entries = self.ProcessFile(file_path, reset_args)
+                        for entry in entries:
+                            self.write_entry(writer, entry, targets_writer, args.targets_format == "seed")
+                        manifest.record(key, file_path, entries, self.run_seed)
+        if targets_writer is not None:
+            targets_writer.close()
+        self.close_shards()
+
+        print(f"Analysis results saved to {json_paths}")
+
+    def MultiFileParallel(self, args, tasks, writer, targets_writer=None, manifest=None):
+        """
+        Spread `(file_path, file_args, manifest_key)` tasks across a pool of `args.workers` processes.
+
+        Every file draws from its own streams of the run seed. Finished results
+        are written in task order as soon as all earlier files are done, and a file
+        that raises is reported and skipped (and not recorded in the manifest)
+        instead of stopping the run.
+        """
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from tqdm import tqdm
+
+        pending = {}
+        next_idx = 0
+        failed = []
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {}
+            for idx, (file_path, reset_args, _) in enumerate(tasks):
+                futures[pool.submit(_process_file_worker, file_path, reset_args, self.run_seed)] = idx
+
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Simulating MRI files"):
+                idx = futures[future]
+                try:
+                    pending[idx], events = future.result()
+                    PROFILER.extend(events)
+                except Exception as e:
+                    pending[idx] = None
+                    failed.append(os.path.basename(tasks[idx][0]))
+                    print(f"Error processing {tasks[idx][0]}: {e}")
+
+                while next_idx in pending:
+                    entries = pending.pop(next_idx)
+                    if entries is not None:
+                        for entry in entries:
+                            self.write_entry(writer, entry, targets_writer, args.targets_format == "seed")
+                        if manifest is not None:
+                            file_path, _, key = tasks[next_idx]
+                            manifest.record(key, file_path, entries, self.run_seed)
+                    next_idx += 1
+
+        if failed:
+            print(f"{len(failed)} of {len(tasks)} files failed: {failed}")
             
+    def SweepFiles(self, args):
+        """
+        Plan a parameter sweep (or load a saved plan) and run it, one file group at a time.
+
+        Every task is a (file, config, seed) row; a file is loaded once for all of its configs.
+        Entries carry their `sweep_task` and `config_id`, and outputs are tagged with the task.
+        """
+        if args.run_plan:
+            plan = load_plan(args.run_plan)
+            print(f"Loaded {len(plan)} tasks from {args.run_plan}")
+            Path(args.o).mkdir(parents=True, exist_ok=True)
+            Path(args.gif_dir).mkdir(parents=True, exist_ok=True)
+        else:
+            _ = self.SetUp(args)
+            if args.sim_img == "single_img":
+                files = [args.i]
+            else:
+                files = sorted(os.path.join(args.i, f) for f in os.listdir(args.i) if f.endswith(('.nii', '.nii.gz')))
+            configs = sweep_configs(Opts(rng=np.random.default_rng(self.run_seed)), args.sim_mode, args.sim_type,
+                                    args.sweep, args.sweep_samples, args.sweep_levels, rng=self.run_seed)
+            plan = plan_sweep(files, configs, self.run_seed)
+            plan_path = args.plan_file or os.path.join(args.o, "sweep_plan.jsonl")
+            save_plan(plan, plan_path)
+            print(f"Planned {len(configs)} configs x {len(files)} files = {len(plan)} tasks, saved to {plan_path}")
+
+        json_path = args.json_file or os.path.join(args.o, "sweep_results.jsonl")
+        from tqdm import tqdm
+        targets_writer = self.open_targets(args, json_path)
+        self.shard_writer = self.open_shards(args)
+        with ResultsWriter(json_path) as writer, GifWriter() as self.gif_writer:
+            for file_path, tasks in tqdm(group_tasks(plan), desc="Sweeping MRI files"):
+                for entry in self.SweepFile(file_path, tasks, args):
+                    self.write_entry(writer, entry, targets_writer, args.targets_format == "seed")
+        if targets_writer is not None:
+            targets_writer.close()
+        self.close_shards()
+
+        print(f"Analysis results saved to {json_path}")
+
+    def SweepFile(self, file_path, tasks, args):
+        """Load one file and run every sweep task planned for it, each with its own config and seed."""
+        simulator = ArtifactSimulator(file_path, lazy=args.lazy, cache=self.open_cache(args),
+                                      compute_dtype=args.compute_dtype)
+        base_name = os.path.splitext(os.path.splitext(os.path.basename(file_path))[0])[0]
+        entries = []
+        for task in tasks:
+            task_args = apply_config(args, task["config"])
+            self.run_seed = task["seed"]
+            for entry in self.SimOps(simulator, base_name, task_args, file_path, tag=f"_task{task['task']}"):
+                entry["sweep_task"] = task["task"]
+                entry["config_id"] = task["config_id"]
+                entries.append(entry)
+        return entries
+
+    def MultiFilePipeline(self, args, tasks, writer, targets_writer=None, manifest=None):
+        """
+        Run `(file_path, file_args, manifest_key)` tasks as a staged pipeline in this process.
+
+        Loading, simulation, GIF encoding and output writing are separate stages with
+        `--stage_workers` threads each, joined by queues of `--queue_size` files, so reads
+        and writes overlap with compute. A file is only loaded once its estimated decoded
+        volume plus outputs fit in `--pipeline_memory`. Results are written in task order and
+        a failing file is reported and skipped, as with --workers.
+        """
+        from tqdm import tqdm
+
+        def cost(task):
+            file_path, file_args, _ = task
+            outputs = len(file_args.sim_type) if file_args.sim_mode == "independent" else 1
+            img = nib.load(file_path)
+            dtype = img.get_data_dtype() if file_args.compute_dtype == "native" else np.dtype(file_args.compute_dtype)
+            return int(np.prod(img.shape)) * dtype.itemsize * (1 + outputs * file_args.variants)
+
+        def add_stage_times(times, mark):
+            # A stage thread works on one file at a time, so its events since `mark` belong to that file
+            for name, seconds in PROFILER.stage_times(mark).items():
+                times[name] = round(times.get(name, 0.0) + seconds, 6)
+
+        def load(task):
+            mark = PROFILER.mark()
+            file_path, file_args, _ = task
+            simulator = ArtifactSimulator(file_path, lazy=file_args.lazy, cache=self.open_cache(file_args),
+                                          compute_dtype=file_args.compute_dtype)
+            if file_args.clear_state:
+                simulator.clear_state()
+            times = {}
+            add_stage_times(times, mark)
+            return task, simulator, [], times
+
+        def simulate(state):
+            mark = PROFILER.mark()
+            task, simulator, _, times = state
+            file_path, file_args, _ = task
+            base_name = os.path.splitext(os.path.splitext(os.path.basename(file_path))[0])[0]
+            outputs = list(self.SimEntries(simulator, base_name, file_args, file_path))
+            add_stage_times(times, mark)
+            return task, simulator, outputs, times
+
+        def preview(state):
+            mark = PROFILER.mark()
+            task, _, outputs, times = state
+            for data, _, output_name, _ in outputs:
+                self.PreviewOps(data, output_name, task[1])
+            add_stage_times(times, mark)
+            return state
+
+        def write(state):
+            mark = PROFILER.mark()
+            task, simulator, outputs, times = state
+            entries = [self.WriteOps(simulator, data, entry, output_name, task[1]) for data, entry, output_name, _ in outputs]
+            add_stage_times(times, mark)
+            if PROFILER.enabled:
+                for entry in entries:
+                    entry["stage_times"] = times
+            return entries
+
+        load_workers, sim_workers, preview_workers, write_workers = args.stage_workers
+        stages = [Stage("load", load, load_workers), Stage("simulate", simulate, sim_workers),
+                  Stage("preview", preview, preview_workers), Stage("write", write, write_workers)]
+        budget = MemoryBudget(int(args.pipeline_memory * 2 ** 20))
+
+        pending = {}
+        next_idx = 0
+        failed = []
+        for idx, entries, error in tqdm(run_pipeline(tasks, stages, args.queue_size, budget, cost),
+                                        total=len(tasks), desc="Simulating MRI files"):
+            if error is not None:
+                entries = None
+                failed.append(os.path.basename(tasks[idx][0]))
+                print(f"Error processing {tasks[idx][0]}: {error}")
+            pending[idx] = entries
+
+            while next_idx in pending:
+                entries = pending.pop(next_idx)
+                if entries is not None:
+                    for entry in entries:
+                        self.write_entry(writer, entry, targets_writer, args.targets_format == "seed")
+                    if manifest is not None:
+                        file_path, _, key = tasks[next_idx]
+                        manifest.record(key, file_path, entries, self.run_seed)
+                next_idx += 1
+
+        if failed:
+            print(f"{len(failed)} of {len(tasks)} files failed: {failed}")
+
     def SingleFile(self, args):
         _ = self.SetUp(args)
         
         
         file_path = args.i
+        args = self.get_fixed_range(file_path)
         base_name = os.path.splitext(os.path.splitext(os.path.basename(file_path))[0])[0]
-        json_name = f"{base_name}_{'_'.join(args.sim_type)}" if len(args.sim_type) >1 else f"{base_name}_{args.sim_type}.json"
-        json_path = os.path.join(args.o, json_name) 
+        json_name = f"{base_name}_{'_'.join(args.sim_type)}.jsonl"
+        json_path = args.json_file or os.path.join(args.o, json_name) 
         
         
         print(f"Processing {file_path} in {args.sim_mode} mode with simulations: {args.sim_type}...")
         
-        simulator = ArtifactSimulator(file_path)
-        if args.clear_state:
-            simulator.clear_state()
-        
-        analysis_results = []
-        single_analysis_results = self.SimOps(simulator, base_name, args)
-        analysis_results.append(single_analysis_results)
+        targets_writer = self.open_targets(args, json_path)
+        self.shard_writer = self.open_shards(args)
+        with ResultsWriter(json_path) as writer, GifWriter() as self.gif_writer:
+            for entry in self.ProcessFile(file_path, args):
+                self.write_entry(writer, entry, targets_writer, args.targets_format == "seed")
+        if targets_writer is not None:
+            targets_writer.close()
+        self.close_shards()
         
-        self.write_to_json(json_path, analysis_results)
+        print(f"Analysis results saved to {json_path}")
         
         
     def run(self):
         args = self.get_fixed_range()
-        if args.sim_img == "single_img":
+        PROFILER.reset(enabled=args.profile)
+        print(f"Run seed: {self.run_seed}")
+        if args.sweep or args.run_plan:
+            self.SweepFiles(args)
+        elif args.sim_img == "single_img":
             self.SingleFile(args) # args
         elif args.sim_img == "multi_img":
             self.MultiFile(args) # args
         else:
             raise ValueError(f"Unknown simulation image type: {args.sim_img}")
+        if args.profile:
+            PROFILER.print_summary()
+            PROFILER.write_trace(args.trace_file or os.path.join(args.o, "profile_trace.json"))
         
         
+def _process_file_worker(file_path, args, run_seed):
+    """
+    Process-pool entry point: simulate one file with its streams of `run_seed`.
+
+    Returns the file's entries and the profiler events recorded for it in this worker.
+    """
+    PROFILER.reset(enabled=args.profile)  # forked workers inherit the parent's events
+    cli = RunCLI()
+    cli.run_seed = run_seed
+    with GifWriter() as cli.gif_writer:
+        entries = cli.ProcessFile(file_path, args)
+    return entries, PROFILER.drain()
+
+
 if __name__ == "__main__":
     cli = RunCLI()
     cli.run()
\ No newline at end of file
@@ -0,0 +1,148 @@
+import multiprocessing as mp
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from param import Opts, get_simulations
+from simulator import ArtifactSimulator
+from volume_cache import VolumeCache
+
+_DONE = "__done__"
+
+
+class ArtifactStream:
+    """
+    Generate simulated volumes in memory for on-the-fly training augmentation.
+
+    Iterating yields `(volume, targets)` pairs, forever or for `n_samples` samples. Each
+    sample picks a file from `file_paths`, draws fresh parameters the way `param.Opts`
+    does and runs `ArtifactSimulator.simulate`; nothing is written to disk. Independent
+    mode yields one pair per simulation type.
+
+    Args:
+        file_paths (list): NIfTI files to sample from
+        n_samples (int): Number of samples to generate (None: forever)
+        sim_mode (str): Simulation mode (default: `Opts().sim_mode`)
+        sim_type (list): Simulation types (default: `Opts().sim_type`)
+        prefetch (int): Number of background producers keeping the queue full (0: generate inline)
+        backend (str): 'thread' or 'process' producers
+        queue_size (int): Maximum number of prefetched samples held in memory
+        cache_size (int): Number of loaded volumes kept per producer
+        lazy (bool): Load volumes lazily (see `ArtifactSimulator`)
+        cache_dir (str): Directory of a persistent decoded-volume cache shared by all producers (None: no cache)
+        compute_dtype (str): Dtype volumes are simulated in: 'native', 'float32' or 'float64'
+        seed (int): Seed for file selection, parameter draws and simulations
+    """
+
+    def __init__(self, file_paths, n_samples=None, sim_mode=None, sim_type=None, prefetch=0,
+                 backend="thread", queue_size=8, cache_size=4, lazy=False, seed=None, cache_dir=None,
+                 compute_dtype="float64"):
+        if not file_paths:
+            raise ValueError("file_paths must contain at least one NIfTI file")
+        if backend not in ("thread", "process"):
+            raise ValueError("backend must be 'thread' or 'process'")
+        self.options = {
+            "file_paths": list(file_paths),
+            "sim_mode": sim_mode,
+            "sim_type": sim_type,
+            "cache_size": cache_size,
+            "lazy": lazy,
+            "cache_dir": cache_dir,
+            "compute_dtype": compute_dtype,
+        }
+        self.n_samples = n_samples
+        self.prefetch = prefetch
+        self.backend = backend
+        self.queue_size = queue_size
+        self.seed = seed
+
+    def _counts(self):
+        """Split `n_samples` across the producers (None for endless producers)."""
+        if self.n_samples is None:
+            return [None] * self.prefetch
+        base, extra = divmod(self.n_samples, self.prefetch)
+        return [base + (1 if i < extra else 0) for i in range(self.prefetch)]
+
+    def __iter__(self):
+        seeds = np.random.SeedSequence(self.seed).spawn(max(self.prefetch, 1))
+        if self.prefetch <= 0:
+            yield from _generate_samples(self.options, self.n_samples, seeds[0])
+            return
+
+        if self.backend == "thread":
+            out_queue = queue.Queue(maxsize=self.queue_size)
+            stop = threading.Event()
+            producers = [threading.Thread(target=_produce, args=(self.options, count, seed, out_queue, stop), daemon=True)
+                         for count, seed in zip(self._counts(), seeds)]
+        else:
+            ctx = mp.get_context()
+            out_queue = ctx.Queue(maxsize=self.queue_size)
+            stop = ctx.Event()
+            producers = [ctx.Process(target=_produce, args=(self.options, count, seed, out_queue, stop), daemon=True)
+                         for count, seed in zip(self._counts(), seeds)]
+
+        for producer in producers:
+            producer.start()
+        running = len(producers)
+        try:
+            while running:
+                item = out_queue.get()
+                if isinstance(item, str) and item == _DONE:
+                    running -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            # Unblock producers waiting on a full queue so they can see the stop flag.
+            while any(p.is_alive() for p in producers):
+                try:
+                    out_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+def _generate_samples(options, count, seed):
+    """Yield `count` samples (forever if None) for one producer."""
+    rng = np.random.default_rng(seed)
+    simulators = OrderedDict()
+    cache = VolumeCache(options["cache_dir"]) if options["cache_dir"] else None
+    produced = 0
+    while count is None or produced < count:
+        path = options["file_paths"][rng.integers(len(options["file_paths"]))]
+        simulator = simulators.pop(path, None) or ArtifactSimulator(path, lazy=options["lazy"], cache=cache,
+                                                                      compute_dtype=options["compute_dtype"])
+        simulators[path] = simulator
+        if len(simulators) > options["cache_size"]:
+            simulators.popitem(last=False)
+
+        opts = Opts(rng=rng)
+        sim_mode = options["sim_mode"] or opts.sim_mode
+        if options["sim_type"] is not None:
+            opts.sim_type = options["sim_type"]
+        result = simulator.simulate(get_simulations(opts), mode=sim_mode, rng=rng)
+        for volume, targets in (result if sim_mode == "independent" else [result]):
+            if count is not None and produced >= count:
+                break
+            yield volume, targets
+            produced += 1
+
+
+def _produce(options, count, seed, out_queue, stop):
+    """Producer entry point: push samples into `out_queue` until done or stopped."""
+    try:
+        for sample in _generate_samples(options, count, seed):
+            while not stop.is_set():
+                try:
+                    out_queue.put(sample, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    except Exception as e:
+        out_queue.put(e)
+    out_queue.put(_DONE)
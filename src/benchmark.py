@@ -0,0 +1,212 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import nibabel as nib
+import numpy as np
+
+from gif_visualizer import save_gif
+from simulator import ArtifactSimulator
+from volume_cache import VolumeCache
+
+# Synthetic volume sizes: MNI 2mm and 1mm templates, and a 0.7mm high-resolution scan
+SIZES = {
+    'mni2mm': (91, 109, 91),
+    'mni1mm': (182, 218, 182),
+    'hires': (256, 256, 256),
+}
+
+# Fixed simulation parameters so every run times the same work
+SIMULATIONS = {
+    'missing_slides': {'type': 'missing_slides', 'remove_param': 0.1, 'axis': 0},
+    'wrong_sequence': {'type': 'wrong_sequence', 'shuffle_param': 0.3, 'axis': 0},
+    'mixed_axis': {'type': 'mixed_axis', 'axis_list': [0, 1, 2], 'weight_param': 0.3},
+}
+
+CASES = ('load', 'load_lazy', 'load_cached', 'missing_slides', 'wrong_sequence', 'mixed_axis',
+         'independent', 'chained', 'save_gif', 'save_3d', 'save_3d_source', 'save_nii', 'save_jpeg')
+
+
+def parse_size(value):
+    """Accept a named size from SIZES or an explicit shape such as 128x128x96."""
+    if value in SIZES:
+        return value, SIZES[value]
+    try:
+        shape = tuple(int(n) for n in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Unknown size {value!r}: use one of {sorted(SIZES)} or DxHxW")
+    if len(shape) != 3:
+        raise argparse.ArgumentTypeError(f"Size {value!r} must have three dimensions")
+    return value, shape
+
+
+def make_volume(shape, path, seed=0):
+    """Write a synthetic int16 brain-like NIfTI volume (smooth ellipsoid plus noise) to `path`."""
+    rng = np.random.default_rng(seed)
+    grids = np.ogrid[tuple(slice(0, n) for n in shape)]
+    radius = sum(((g - n / 2) / (n / 2.5)) ** 2 for g, n in zip(grids, shape))
+    data = np.clip(1000 * (1 - radius), 0, None) + rng.normal(0, 20, shape)
+    img = nib.Nifti1Image(data.astype(np.int16), np.diag([1.0, 1.0, 1.0, 1.0]))
+    nib.save(img, path)
+
+
+def measure(func, repeat):
+    """Time `func` `repeat` times, then run it once more under tracemalloc for the peak allocation."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def build_cases(path, workdir):
+    """Return a callable per benchmark case for the volume stored at `path`."""
+    sim = ArtifactSimulator(path)
+    cache = VolumeCache(os.path.join(workdir, 'cache'))
+    ArtifactSimulator(path, cache=cache)  # fill the cache so the timed runs are hits
+    chained, _ = sim.simulate(list(SIMULATIONS.values()), mode='chained')
+    cases = {
+        'load': lambda: ArtifactSimulator(path),
+        'load_lazy': lambda: ArtifactSimulator(path, lazy=True),
+        'load_cached': lambda: ArtifactSimulator(path, cache=cache),
+        'independent': lambda: sim.simulate(list(SIMULATIONS.values()), mode='independent'),
+        'chained': lambda: sim.simulate(list(SIMULATIONS.values()), mode='chained'),
+        'save_gif': lambda: save_gif(chained, os.path.join(workdir, 'bench.gif')),
+        'save_3d': lambda: sim.save_data(chained, '3d', 0, os.path.join(workdir, 'bench.nii.gz')),
+        'save_3d_source': lambda: sim.save_data(chained, '3d', 0, os.path.join(workdir, 'bench_source.nii.gz'), keep_dtype=True),
+        'save_nii': lambda: sim.save_data(chained, '3d', 0, os.path.join(workdir, 'bench.nii')),
+        'save_jpeg': lambda: sim.save_data(chained, 'jpeg', 0, os.path.join(workdir, 'jpeg')),
+    }
+    for name, config in SIMULATIONS.items():
+        cases[name] = lambda config=config: sim.simulate([config], mode='single')
+    return cases
+
+
+def run_benchmarks(sizes, cases, repeat, seed):
+    results = []
+    with tempfile.TemporaryDirectory(prefix='neuroglitch_bench_') as workdir:
+        for size_name, shape in sizes:
+            path = os.path.join(workdir, f'{size_name}.nii.gz')
+            make_volume(shape, path, seed)
+            voxels = int(np.prod(shape))
+            np.random.seed(seed)
+            random.seed(seed)
+            with contextlib.redirect_stdout(io.StringIO()):
+                available = build_cases(path, workdir)
+            for case in cases:
+                np.random.seed(seed)
+                random.seed(seed)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    times, peak = measure(available[case], repeat)
+                median = statistics.median(times)
+                results.append({
+                    'case': case,
+                    'size': size_name,
+                    'shape': list(shape),
+                    'repeat': repeat,
+                    'median_s': median,
+                    'min_s': min(times),
+                    'mvoxels_per_s': voxels / median / 1e6,
+                    'peak_mb': peak / 2 ** 20,
+                })
+                print(f"{size_name:>10} {case:<15} {median * 1000:10.1f} ms {voxels / median / 1e6:10.1f} Mvox/s {peak / 2 ** 20:9.1f} MB")
+    return results
+
+
+def measure_import_time(module='NeuroGlitch', runs=3):
+    """Best-of-`runs` wall time in ms for a fresh interpreter to import `module`."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=src_dir, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+    return min(samples)
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Print the slowdown of every case against a saved baseline and return the regressed cases.
+
+    Cases are compared on their fastest run, which is far less sensitive to noise from
+    other processes than the median.
+    """
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['case'], r['size']): r for r in json.load(f)['results']}
+
+    regressions = []
+    print(f"\nComparison against {baseline_path} (tolerance {tolerance:.0%})")
+    for result in results:
+        base = baseline.get((result['case'], result['size']))
+        if base is None:
+            continue
+        ratio = result['min_s'] / base['min_s']
+        status = 'REGRESSION' if ratio > 1 + tolerance else 'ok'
+        print(f"{result['size']:>10} {result['case']:<15} {base['min_s'] * 1000:10.1f} -> {result['min_s'] * 1000:10.1f} ms  x{ratio:5.2f}  {status}")
+        if status != 'ok':
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NeuroGlitch simulations and output writers on synthetic volumes.")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(name, shape) for name, shape in SIZES.items()],
+                        help=f"Volume sizes to run: {', '.join(SIZES)} or DxHxW (default: all named sizes)")
+    parser.add_argument("--cases", type=str, nargs="+", choices=CASES, default=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic volumes and the simulations")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="Machine-readable results file")
+    parser.add_argument("--baseline", type=str, default=None, help="Results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline before a case counts as a regression")
+    parser.add_argument("--import_budget", type=float, default=None, help="Fail if importing NeuroGlitch takes longer than this many ms")
+    args = parser.parse_args()
+
+    import_ms = measure_import_time()
+    print(f"Import time of NeuroGlitch: {import_ms:.1f} ms")
+    results = run_benchmarks(args.sizes, args.cases, args.repeat, args.seed)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'nibabel': nib.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'import_time_ms': import_ms,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+    failed = False
+    if args.import_budget is not None and import_ms > args.import_budget:
+        print(f"Import time {import_ms:.1f} ms exceeds the budget of {args.import_budget:.1f} ms")
+        failed = True
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,130 @@
-import numpy as np
-import imageio
-from pathlib import Path
-
-def save_gif(data, output_name, axis=0, duration=0.1, percentage=0.3):
-    """
-    Save a GIF from the first percentage of slides along specified axis.
-    
-    Args:
-        data (np.ndarray): 3D numpy array of NIfTI data
-        output_name (str): Name for the output GIF file
-        axis (int): Axis along which to take slices (0, 1, or 2)
-        duration (float): Seconds per frame in GIF
-        percentage (float): Fraction of slices to include (0-1)
-    """
-    #Path('gifs').mkdir(exist_ok=True)
-    
-    n_slices = data.shape[axis]
-    n_frames = int(n_slices * percentage)
-    
-    frames = []
-    if axis == 0:
-        slices = data[:n_frames, :, :]
-    elif axis == 1:
-        slices = data[:, :n_frames, :]
-    else:
-        slices = data[:, :, :n_frames]
-    
-    for i in range(n_frames):
-        frame = slices[i, :, :] if axis == 0 else \
-                slices[:, i, :] if axis == 1 else \
-                slices[:, :, i]
-        frame = (frame - frame.min()) / (frame.max() - frame.min() + 1e-10) * 255
-        frame = frame.astype(np.uint8)
-        rot_frame = np.rot90(frame, k=1)
-        frames.append(rot_frame)
-    
-    gif_path = f'../gifs/{output_name}'
-    imageio.mimsave(gif_path, frames, duration=duration)
-    print(f"Saved GIF: {gif_path}")
\ No newline at end of file
+import os
+import queue
+import threading
+import numpy as np
+from pathlib import Path
+from profiler import PROFILER
+
+def slices_to_uint8(data, axis=0, n_slices=None, eps=0.0):
+    """
+    Normalize slices along `axis` to uint8 and rotate them by 90 degrees in one vectorized pass.
+
+    Each slice is scaled with its own min/max as `(x - min) / (max - min + eps) * 255`;
+    constant slices become 0.
+
+    Args:
+        data (np.ndarray): 3D numpy array of NIfTI data
+        axis (int): Axis along which to take slices (0, 1, or 2)
+        n_slices (int): Number of leading slices to convert (None: all)
+        eps (float): Added to every slice range before dividing
+
+    Returns:
+        np.ndarray: (n_slices, height, width) uint8 frames
+    """
+    n_slices = data.shape[axis] if n_slices is None else n_slices
+    slab = np.moveaxis(np.asarray(data[(slice(None),) * axis + (slice(0, n_slices),)]), axis, 0)
+    if slab.dtype.kind in "iu":
+        # Native integer data (--keep_dtype) would wrap around in x - min and max - min
+        slab = slab.astype(np.float32, copy=False)
+
+    min_val = slab.min(axis=(1, 2), keepdims=True)
+    value_range = slab.max(axis=(1, 2), keepdims=True) - min_val + eps
+    # A constant slice has x - min == 0 everywhere, so any non-zero divisor maps it to 0.
+    frames = ((slab - min_val) / np.where(value_range > 0, value_range, 1) * 255).astype(np.uint8)
+    return np.ascontiguousarray(np.rot90(frames, k=1, axes=(1, 2)))
+
+def gif_frames(data, axis=0, percentage=0.3):
+    """
+    Build uint8 GIF frames from the first percentage of slides along specified axis.
+
+    Args:
+        data (np.ndarray): 3D numpy array of NIfTI data
+        axis (int): Axis along which to take slices (0, 1, or 2)
+        percentage (float): Fraction of slices to include (0-1)
+
+    Returns:
+        np.ndarray: (n_frames, height, width) uint8 frames
+    """
+    n_slices = int(data.shape[axis] * percentage)
+    if data.ndim == 4:
+        # A 4D series is previewed through its first volume; one key picks both the previewed
+        # slices and the timepoint, so a lazy SimulatedVolume gathers only those.
+        data = data[(slice(None),) * axis + (slice(0, n_slices), Ellipsis, 0)]
+    return slices_to_uint8(data, axis=axis, n_slices=n_slices, eps=1e-10)
+
+def montage(frames, rows=2, cols=6):
+    """Tile up to rows*cols frames into one uint8 image, leaving unused cells black."""
+    frames = frames[:rows * cols]
+    height, width = frames.shape[1:]
+    grid = np.zeros((rows * cols, height, width), dtype=np.uint8)
+    grid[:len(frames)] = frames
+    return grid.reshape(rows, cols, height, width).transpose(0, 2, 1, 3).reshape(rows * height, cols * width)
+
+def save_gif(data, output_name, axis=0, duration=0.1, percentage=0.3, gif_dir=None, writer=None):
+    """
+    Save a GIF from the first percentage of slides along specified axis.
+
+    Args:
+        data (np.ndarray): 3D numpy array of NIfTI data
+        output_name (str): Name or path for the output GIF file
+        axis (int): Axis along which to take slices (0, 1, or 2)
+        duration (float): Seconds per frame in GIF
+        percentage (float): Fraction of slices to include (0-1)
+        gif_dir (str): Directory joined in front of `output_name` (None: use `output_name` as given)
+        writer (GifWriter): Background writer to hand the encoding to (None: encode now)
+    """
+    gif_path = os.path.join(gif_dir, output_name) if gif_dir else output_name
+    frames = gif_frames(data, axis=axis, percentage=percentage)
+
+    if writer is not None:
+        writer.submit(frames, gif_path, duration)
+        return
+    import imageio  # deferred so runs that never write a GIF do not pay for it
+    imageio.mimsave(gif_path, list(frames), duration=duration)
+    print(f"Saved GIF: {gif_path}")
+
+
+class GifWriter:
+    """
+    Encode GIFs on a background thread so previews overlap with the next simulation.
+
+    At most `max_pending` GIFs wait in the queue; `submit` blocks when it is full, which
+    bounds the memory held by pending frames. Call `close` to wait for all pending GIFs.
+    """
+
+    def __init__(self, max_pending=4):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frames, gif_path, duration=0.1):
+        self._queue.put((frames, gif_path, duration))
+
+    def _run(self):
+        import imageio
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            frames, gif_path, duration = item
+            try:
+                Path(gif_path).parent.mkdir(parents=True, exist_ok=True)
+                with PROFILER.stage("gif_encode"):
+                    imageio.mimsave(gif_path, list(frames), duration=duration)
+                print(f"Saved GIF: {gif_path}")
+            except Exception as e:
+                self.errors.append((gif_path, e))
+                print(f"Error saving GIF {gif_path}: {e}")
+
+    def close(self):
+        """Wait until every submitted GIF is written."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from results_io import ResultsWriter, read_results
+
+# Settings that change what a file's simulation produces or where its outputs go
+CONFIG_KEYS = ('sim_mode', 'sim_type', 'remove_param', 'shuffle_param', 'weight_param', 'mixed_axis_list',
+               'axis', 'variants', 'save_type', 'jpeg_snippet', 'targets_format', 'fixed_range', 'o', 'gif_dir',
+               'per_timepoint', 'compute_dtype', 'shard_layout', 'keep_dtype', 'compression_level', 'out_of_core')
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_identity(file_path, content_hash=False):
+    """
+    Identity of an input: path, size and mtime, or its name, size and content hash with `content_hash`.
+
+    The name stays in the content identity because outputs and seeds are keyed by it: two
+    byte-identical inputs under different names are still two files to simulate.
+    """
+    stat = os.stat(file_path)
+    if content_hash:
+        return {"name": os.path.basename(file_path), "size": stat.st_size, "sha256": file_digest(file_path)}
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def config_hash(args, run_seed):
+    """Short hash of the resolved simulation settings of one file plus the run seed."""
+    config = {key: getattr(args, key, None) for key in CONFIG_KEYS}
+    config["run_seed"] = run_seed
+    encoded = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    JSON Lines record of the (input, config) pairs a multi_img run has completed.
+
+    A record is appended once all result entries of a file are written, keyed by a hash of
+    the input identity and of the file's resolved config, so a re-run with `--resume`
+    skips exactly the files whose input and settings are unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.records = {record["key"]: record for record in read_results(self.path) if "key" in record}
+        self._writer = ResultsWriter(self.path)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def run_seed(self):
+        """Run seed of the most recently completed file, or None for an empty manifest."""
+        for record in reversed(list(self.records.values())):
+            return record.get("run_seed")
+        return None
+
+    def task_key(self, file_path, args, run_seed, content_hash=False):
+        """Key of simulating `file_path` with the resolved settings `args`."""
+        identity = json.dumps(input_identity(file_path, content_hash), sort_keys=True)
+        return hashlib.sha256(f"{identity}|{config_hash(args, run_seed)}".encode("utf-8")).hexdigest()[:24]
+
+    def record(self, key, file_path, entries, run_seed):
+        """Mark a file as done once its result entries have been written."""
+        record = {
+            "key": key,
+            "file": os.path.basename(file_path),
+            "run_seed": run_seed,
+            "entries": len(entries),
+            "outputs": [entry["output_path"] for entry in entries if "output_path" in entry],
+        }
+        self._writer.write(record)
+        self.records[key] = record
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -6,7 +6,8 @@ import numpy as np
 import random
 
 class Opts(object):
-    def __init__(self):
+    def __init__(self, rng=None):
+        # Random settings are drawn from `rng` (np.random.Generator), or the global random state if None
         '''Paths'''
         self.i = '../Sample_Data/'          # MNI152_T1_2mm_brain.nii.gz input_path of input folder fo multiple files
         self.o = '../outputs/'         # output_path
@@ -24,7 +25,7 @@ class Opts(object):
         
         '''Axis'''
         # Axis Param  --axis
-        self.axis = int(np.random.choice([0, 1, 2]))                      # Main axis for simulations
+        self.axis = int((rng or np.random).choice([0, 1, 2]))                      # Main axis for simulations
         
         '''Missing Slides'''
         # Missing Slides Param  --remove_param
@@ -32,7 +33,8 @@ class Opts(object):
         self.remove_param_lower = 1    #0.01      # minimum number or % of slides to remove
         self.remove_param = self.get_type_value(
             self.remove_param_lower, 
-            self.remove_param_upper
+            self.remove_param_upper,
+            rng
             )                # Number/fraction (e.g., 5 or 0.2) of slides to remove (missing_slides) fraction must be less than 1
         
         
@@ -43,7 +45,8 @@ class Opts(object):
         self.shuffle_param_lower = 0.01         # minimum number or % of slides to shuffle
         self.shuffle_param = self.get_type_value(
             self.shuffle_param_lower, 
-            self.shuffle_param_upper
+            self.shuffle_param_upper,
+            rng
             )                  # Number/fraction  (e.g., 5 or 0.2) of slides to shuffle (wrong_sequence), fraction must be less than 1
         
         
@@ -53,12 +56,13 @@ class Opts(object):
         self.weight_param_lower = 0.01          # minimum number or % of slides to draw from a different axis
         self.weight_param = self.get_type_value(
             self.weight_param_lower, 
-            self.weight_param_upper
+            self.weight_param_upper,
+            rng
             )               # Number/fraction  (e.g., 5 or 0.2) of slides to shuffle (wrong_sequence), fraction must be less than 1
         
         # Mixed Axis List Param  --mixed_axis_list
         self.axis_string_list = ['0,1', '0,2', '1,0', '2,0', '1,2', '2,1', '0,1,2', '0,2,1', '1,0,2', '1,2,0', '2,0,1', '2,1,0']                # Must be interger Axes for mixed_axis (e.g., 0 1 2) e.g '0,1' or '0,2' or '1,2' or '0,1,2'
-        self.mixed_axis_list = self.select_mixed_axis()
+        self.mixed_axis_list = self.select_mixed_axis(rng)
         
         '''Save Image'''
         # Save Type Param  --save_type
@@ -77,9 +81,17 @@ class Opts(object):
         # Take a list for independent and chain simulation and string for single
         self.sim_type = ["missing_slides", "wrong_sequence", "mixed_axis"] #'wrong_sequence'        # or ["missing_slides", "wrong_sequence", "mixed_axis"] for independent or chained       # Simulation types choices=["missing_slides", "wrong_sequence", "mixed_axis"]
 
-    def get_type_value(self, lower, upper):
+    def resample(self, rng=None):
+        """Redraw the randomized settings, in the same order as `__init__` draws them."""
+        self.axis = int((rng or np.random).choice([0, 1, 2]))
+        self.remove_param = self.get_type_value(self.remove_param_lower, self.remove_param_upper, rng)
+        self.shuffle_param = self.get_type_value(self.shuffle_param_lower, self.shuffle_param_upper, rng)
+        self.weight_param = self.get_type_value(self.weight_param_lower, self.weight_param_upper, rng)
+        self.mixed_axis_list = self.select_mixed_axis(rng)
+
+    def get_type_value(self, lower, upper, rng=None):
         """Generates a random weight parameter, ensuring it's an int if possible."""
-        value = np.random.uniform(lower, upper)
+        value = (rng or np.random).uniform(lower, upper)
         return self.int_or_float(value)
     
     def int_or_float(self, value):
@@ -91,7 +103,7 @@ class Opts(object):
         return k
 
     
-    def select_mixed_axis(self):
+    def select_mixed_axis(self, rng=None):
         """
         Selects a mixed axis string from a list based on the given axis.
 
@@ -110,7 +122,10 @@ class Opts(object):
         if not matching_strings:
             return None  # No matching axis string found
 
-        selected_string = random.choice(matching_strings) #choose a random matching string.
+        if rng is None:
+            selected_string = random.choice(matching_strings) #choose a random matching string.
+        else:
+            selected_string = matching_strings[rng.integers(len(matching_strings))]
 
         if ',' in selected_string:
             # Comma-separated values
@@ -122,5 +137,14 @@ class Opts(object):
         return mixed_axis_list
 
 
+def get_simulations(args):
+    """Build the ordered list of simulation configs for `args.sim_type` from an Opts or argparse namespace."""
+    sim_configs = {}
+    if "missing_slides" in args.sim_type:
+        sim_configs["missing_slides"] = {'type': 'missing_slides', 'remove_param': args.remove_param, 'axis': args.axis}
+    if "wrong_sequence" in args.sim_type:
+        sim_configs["wrong_sequence"] = {'type': 'wrong_sequence', 'shuffle_param': args.shuffle_param, 'axis': args.axis}
+    if "mixed_axis" in args.sim_type:
+        sim_configs["mixed_axis"] = {'type': 'mixed_axis', 'axis_list': args.mixed_axis_list, 'weight_param': args.weight_param}
 
-
+    return [sim_configs[sim_type] for sim_type in args.sim_type]
@@ -0,0 +1,122 @@
+import queue
+import threading
+
+from profiler import PROFILER
+
+_DONE = object()  # end-of-stream marker passed down the stage queues
+
+
+class MemoryBudget:
+    """
+    Byte counter that blocks admission of new items while the pipeline holds too much.
+
+    An item larger than the whole budget is still admitted once nothing else is in flight,
+    so a single oversized volume cannot stall the run.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self._cond:
+            while self.used and self.used + nbytes > self.max_bytes:
+                self._cond.wait()
+            self.used += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+
+class Stage:
+    """One pipeline step: `fn(value) -> value` run by `workers` threads."""
+
+    def __init__(self, name, fn, workers=1):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class _Job:
+    __slots__ = ("index", "value", "nbytes", "error")
+
+    def __init__(self, index, value, nbytes):
+        self.index = index
+        self.value = value
+        self.nbytes = nbytes
+        self.error = None
+
+
+def run_pipeline(items, stages, queue_size=2, budget=None, cost=None):
+    """
+    Push `items` through `stages` on threads connected by bounded queues.
+
+    Every stage has its own worker threads and an input queue of `queue_size` items, so a
+    slow stage holds back the ones before it instead of letting work pile up. With a
+    `MemoryBudget`, an item is only admitted once `cost(item)` bytes fit in it; the bytes
+    are returned when the item leaves the last stage. Yields `(index, value, error)` in
+    completion order; an item whose stage raised skips the remaining stages and carries
+    the exception as `error`.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages] + [queue.Queue()]
+
+    def feed():
+        for index, item in enumerate(items):
+            job = _Job(index, item, 0)
+            try:
+                job.nbytes = cost(item) if cost is not None else 0
+            except Exception as e:
+                job.error = e
+            if budget is not None:
+                budget.acquire(job.nbytes)
+            queues[0].put(job)
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+
+    lock = threading.Lock()
+    remaining = [stage.workers for stage in stages]  # live workers per stage
+
+    def work(position, stage):
+        inbox, outbox = queues[position], queues[position + 1]
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                break
+            if job.error is None:
+                try:
+                    with PROFILER.stage(f"pipeline_{stage.name}"):
+                        job.value = stage.fn(job.value)
+                except Exception as e:
+                    job.error = e
+            outbox.put(job)
+        with lock:
+            remaining[position] -= 1
+            last = remaining[position] == 0
+        if last:  # the stage is drained: let every worker of the next stage stop
+            following = stages[position + 1].workers if position + 1 < len(stages) else 1
+            for _ in range(following):
+                outbox.put(_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True, name="pipeline_feed")]
+    for position, stage in enumerate(stages):
+        threads += [threading.Thread(target=work, args=(position, stage), daemon=True,
+                                     name=f"pipeline_{stage.name}_{n}") for n in range(stage.workers)]
+    for thread in threads:
+        thread.start()
+
+    results = queues[-1]
+    while True:
+        job = results.get()
+        if job is _DONE:
+            break
+        if budget is not None:
+            budget.release(job.nbytes)
+        yield job.index, job.value, job.error
+    for thread in threads:
+        thread.join()
+
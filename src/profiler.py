@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class StageProfiler:
+    """
+    Lightweight wall-clock timing of named pipeline stages.
+
+    While disabled, `stage` and `iterate` only check a flag. While enabled, every timed stage
+    is kept as a Chrome trace "complete" event tagged with process and thread ids. Timestamps
+    come from `time.time()`, so events recorded in worker processes line up with the parent's.
+    Nested stages (e.g. a lazy decode inside `simulate`) are counted in both stages.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self._lock = threading.Lock()
+
+    def reset(self, enabled=None):
+        """Drop all recorded events, optionally switching profiling on or off."""
+        with self._lock:
+            self.events = []
+        if enabled is not None:
+            self.enabled = enabled
+
+    def record(self, name, start, duration, **args):
+        """Store one finished stage that started at `start` (seconds since the epoch)."""
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def stage(self, name, **args):
+        """Time the enclosed block as stage `name`."""
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - begin, **args)
+
+    def iterate(self, name, iterable, **args):
+        """Yield from `iterable`, timing the work of producing every item as stage `name`."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            begin = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, start, time.perf_counter() - begin, **args)
+            yield item
+
+    def mark(self):
+        """Position in the event list, to pass to `stage_times` later."""
+        return len(self.events)
+
+    def stage_times(self, since=0, thread_only=True):
+        """Total seconds per stage for events recorded after `since` (by this thread only by default)."""
+        tid = threading.get_ident()
+        totals = {}
+        with self._lock:
+            events = self.events[since:]
+        for event in events:
+            if thread_only and event["tid"] != tid:
+                continue
+            totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1e6
+        return {name: round(seconds, 6) for name, seconds in totals.items()}
+
+    def drain(self):
+        """Return and forget all recorded events (used to ship worker events to the parent)."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def extend(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+    def print_summary(self):
+        """Print a table of call count, total, mean and share of summed stage time per stage."""
+        with self._lock:
+            events = list(self.events)
+        if not events:
+            print("No profiled stages recorded")
+            return
+        stats = {}
+        for event in events:
+            count, total = stats.get(event["name"], (0, 0.0))
+            stats[event["name"]] = (count + 1, total + event["dur"] / 1e6)
+        overall = sum(total for _, total in stats.values())
+
+        print(f"\n{'stage':<16} {'calls':>7} {'total s':>10} {'mean ms':>10} {'share':>7}")
+        for name, (count, total) in sorted(stats.items(), key=lambda item: -item[1][1]):
+            print(f"{name:<16} {count:>7} {total:>10.3f} {total / count * 1000:>10.2f} {total / overall:>7.1%}")
+        wall = (max(e["ts"] + e["dur"] for e in events) - min(e["ts"] for e in events)) / 1e6
+        print(f"Wall time covered by profiled stages: {wall:.3f} s across {len({e['pid'] for e in events})} process(es)")
+
+    def write_trace(self, path):
+        """Write the recorded events as a Chrome trace JSON file (chrome://tracing, Perfetto)."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Profile trace saved to {path}")
+
+
+# Process-wide profiler used by the CLI, the simulator and the GIF writer
+PROFILER = StageProfiler()
@@ -0,0 +1,86 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: O_APPEND writes are still atomic per record
+    fcntl = None
+
+
+def _json_default(obj):
+    """Convert NumPy scalars and arrays that json cannot serialize on its own."""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ResultsWriter:
+    """
+    Append-only JSON Lines results sink.
+
+    Every `write` encodes one record as a single line and appends it with one `os.write`
+    on an O_APPEND descriptor, under an exclusive file lock where available, so several
+    processes can share a file without interleaving and a crash loses at most the record
+    being written.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = str(path)
+        self.fsync = fsync
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def write(self, entry):
+        """Append one result entry and flush it to the file."""
+        line = (json.dumps(entry, default=_json_default) + "\n").encode("utf-8")
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            view = memoryview(line)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            if self.fsync:
+                os.fsync(self._fd)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_results(path):
+    """
+    Read a JSON Lines results file back as a list of dicts.
+
+    A trailing partial line left by an interrupted write is skipped.
+    """
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return results
@@ -0,0 +1,78 @@
+import os
+import secrets
+import zlib
+
+import numpy as np
+
+from simulator import ArtifactSimulator
+
+# Streams mixed into every task seed: param.Opts draws and simulation draws of a file
+PARAM_STREAM = 0
+SIM_STREAM = 1
+# Stream of the per-config seeds of a parameter sweep (see sweep.py)
+CONFIG_STREAM = 2
+
+
+def new_run_seed():
+    """Fresh random run seed, small enough to be stored in JSON as a plain integer."""
+    return secrets.randbits(63)
+
+
+def file_id(file_name):
+    """Stable integer id of an input file, independent of its directory and of the machine."""
+    return zlib.crc32(os.path.basename(str(file_name)).encode("utf-8"))
+
+
+def task_rng(run_seed, file_name, stream=SIM_STREAM):
+    """Generator of one file's `stream`, derived from the run seed and the file id only."""
+    return np.random.default_rng([run_seed, file_id(file_name), stream])
+
+
+def config_seed(run_seed, config_id):
+    """Run seed of one configuration of a parameter sweep, derived from the sweep's run seed."""
+    return int(np.random.default_rng([run_seed, CONFIG_STREAM, config_id]).integers(2 ** 63))
+
+
+def seed_record(run_seed, file_name, variants=1, index=None, per_timepoint=False, compute_dtype="float64"):
+    """
+    The `seed` field stored in a result entry: everything needed to rebuild its generator.
+
+    `index` is the position of the simulation in an independent run, whose simulations
+    each draw from their own child generator. `per_timepoint` marks 4D runs whose timepoints
+    each got their own draws; `compute_dtype` is kept when not the float64 default, as
+    mixed_axis resampling rounds differently in other dtypes.
+    """
+    record = {"run": run_seed, "file_id": file_id(file_name), "stream": SIM_STREAM, "variants": variants}
+    if index is not None:
+        record["index"] = index
+    if per_timepoint:
+        record["per_timepoint"] = True
+    if compute_dtype != "float64":
+        record["compute_dtype"] = compute_dtype
+    return record
+
+
+def replay_entry(entry, file_path, lazy=False, cache=None):
+    """
+    Regenerate the simulated volume and targets of one result entry from its seed.
+
+    `file_path` is the input the entry was simulated from, optionally read through a
+    `volume_cache.VolumeCache`. Returns `(data, targets)`, identical to the original run's output.
+    """
+    record = entry["seed"]
+    rng = np.random.default_rng([record["run"], record["file_id"], record["stream"]])
+    mode = entry["simulation_mode"]
+    if mode == "chained":
+        simulations = [dict(params, type=sim_type) for sim_type, params in zip(entry["simulation_types"], entry["parameters"])]
+    else:
+        simulations = [dict(entry["parameters"], type=entry["simulation_type"])]
+        if mode == "independent":
+            rng = rng.spawn(record["index"] + 1)[record["index"]]
+        mode = "single"
+
+    simulator = ArtifactSimulator(file_path, lazy=lazy, cache=cache, compute_dtype=record.get("compute_dtype", "float64"))
+    if record["variants"] > 1:
+        for variant, result in enumerate(simulator.simulate_variants(simulations, record["variants"], mode=mode, rng=rng)):
+            if variant == entry["variant"]:
+                return result
+    return simulator.simulate(simulations, mode=mode, rng=rng, per_timepoint=record.get("per_timepoint", False))
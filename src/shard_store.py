@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from results_io import _json_default
+from targets_store import pack_target, unpack_target
+
+SHARD_LAYOUTS = ("volume", "slice")
+# Targets with one value per output slice along the simulated axis, by simulation type; chains along one axis
+# keep `final_to_original` and `source_axis` in output order. Others (e.g. the argsort in `sequence_target` of
+# wrong_sequence) are indexed by original slice or rank and stay whole.
+SLICE_TARGETS = {'missing_slides': ('sequence_target',), 'mixed_axis': ('axis_source',),
+                 'chained': ('final_to_original', 'source_axis')}
+INDEX_NAME = "index.jsonl"
+
+_ALIGN = 64  # records start on cache-line boundaries
+
+
+def _step_axis(sim):
+    """Axis along which one simulation step indexes slices."""
+    return sim['axis'] if 'axis' in sim else min(sim['axis_list'])
+
+
+def slice_targets(meta, axis):
+    """Names of the targets in an entry's `meta` that hold one value per output slice along `axis`."""
+    params = meta.get("parameters")
+    if meta.get("simulation_mode") == "chained":
+        chain_axis = params[0]['axis'] if 'axis' in params[0] else params[0]['axis_list'][0]
+        if chain_axis == axis and all(_step_axis(sim) == axis for sim in params):
+            return list(SLICE_TARGETS['chained'])
+        return []
+    if params and _step_axis(params) == axis:
+        return list(SLICE_TARGETS.get(meta.get("simulation_type"), ()))
+    return []
+
+
+class ShardWriter:
+    """
+    Pack simulated volumes and their targets into large shard files for training.
+
+    Records are appended to `shard_00000.bin`, `shard_00001.bin`, ... in `directory`; a
+    new shard is started once the next record would push the current one past
+    `shard_size` bytes (a record larger than that gets a shard of its own). Each record
+    is the volume's raw bytes followed by its targets, encoded as in `targets_store`, in
+    one contiguous 64-byte aligned block. With `layout="slice"` the volume is stored
+    with `axis` first, so every 2D slice is contiguous too, and the record lists the
+    targets `get_slice` can split per slice (see `slice_targets`). The layout of every record
+    is appended as one JSON line to `index.jsonl`. Writes are serialized, so pipeline
+    threads can share one writer; reopening a directory appends to it.
+    """
+
+    def __init__(self, directory, shard_size=1 << 30, layout="volume"):
+        if layout not in SHARD_LAYOUTS:
+            raise ValueError(f"Unknown shard layout: {layout}, expected one of {SHARD_LAYOUTS}")
+        self.directory = Path(directory)
+        self.shard_size = shard_size
+        self.layout = layout
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = open(self.directory / INDEX_NAME, "a+", encoding="utf-8")
+        self._index.seek(0)
+        records = [json.loads(line) for line in self._index if line.strip()]
+        self._records = len(records)
+        self._shard = records[-1]["shard_id"] if records else 0
+        self._data = None
+        self._open_shard()
+
+    def _shard_path(self, shard_id):
+        return self.directory / f"shard_{shard_id:05d}.bin"
+
+    def _open_shard(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = open(self._shard_path(self._shard), "ab")
+        self._offset = self._data.seek(0, os.SEEK_END)
+
+    def write(self, data, targets, meta=None, axis=0):
+        """Append one volume with its array targets and JSON-serializable `meta`; return a pointer to the record."""
+        data = np.asarray(data)
+        if self.layout == "slice":
+            data = np.moveaxis(data, axis, 0)
+        data = np.ascontiguousarray(data)
+
+        # The volume, then each target 8-byte aligned, at offsets relative to the record start
+        chunks, size = [data], data.nbytes
+        record = {"layout": self.layout, "axis": int(axis), "shape": list(data.shape), "dtype": data.dtype.str,
+                  "targets": {}, "meta": meta or {}}
+        if self.layout == "slice":
+            record["slice_targets"] = slice_targets(record["meta"], axis)
+        for name, value in targets.items():
+            stored, layout = pack_target(name, value)
+            chunks.append(b"\0" * (-size % 8))
+            size += -size % 8
+            layout["offset"] = size
+            chunks.append(stored)
+            size += stored.nbytes
+            record["targets"][name] = layout
+        return self._append(chunks, size, record)
+
+    def copy_from(self, reader, record):
+        """Append record `record` of a `ShardReader` byte for byte; return a pointer to the copy."""
+        source = reader.records[record]
+        start = source["offset"]
+        copied = {k: v for k, v in source.items() if k not in ("record", "shard", "shard_id", "offset", "nbytes")}
+        copied["targets"] = {name: dict(layout, offset=layout["offset"] - start) for name, layout in source["targets"].items()}
+        raw = reader._mmap(source["shard"])[start:start + source["nbytes"]]
+        return self._append([raw], source["nbytes"], copied)
+
+    def _append(self, chunks, size, record):
+        """Write a record's `chunks` (`size` bytes) at the end of the current shard and index it."""
+        with self._lock:
+            if self._offset and self._offset + size > self.shard_size:
+                self._shard += 1
+                self._open_shard()
+            start = self._offset
+            for chunk in chunks:
+                self._data.write(chunk)
+            padding = -(start + size) % _ALIGN
+            self._data.write(b"\0" * padding)
+            self._offset = start + size + padding
+            for layout in record["targets"].values():
+                layout["offset"] += start
+
+            record = dict({"record": self._records, "shard": self._shard_path(self._shard).name,
+                           "shard_id": self._shard, "offset": start, "nbytes": size}, **record)
+            self._data.flush()
+            self._index.write(json.dumps(record, default=_json_default) + "\n")
+            self._index.flush()
+            self._records += 1
+        return {"shard": record["shard"], "record": record["record"]}
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ShardReader:
+    """
+    Read a shard directory written by `ShardWriter`.
+
+    Shard files are memory-mapped on first use, and volumes and integer targets come back
+    as zero-copy views into them. Iterating yields `(data, targets)` in storage order,
+    which reads each shard front to back; `reader[i]` gives random access to record i.
+    Slice-layout records can also be addressed per slice with `get_slice`.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / INDEX_NAME, encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        self._mmaps = {}
+        self._slice_starts = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def _mmap(self, shard):
+        if shard not in self._mmaps:
+            self._mmaps[shard] = np.memmap(self.directory / shard, dtype=np.uint8, mode="r")
+        return self._mmaps[shard]
+
+    def meta(self, record):
+        return self.records[record]["meta"]
+
+    def get(self, record):
+        """Return the stored volume (axis first in the slice layout) and targets of one record."""
+        layout = self.records[record]
+        raw = self._mmap(layout["shard"])
+        dtype = np.dtype(layout["dtype"])
+        nbytes = int(np.prod(layout["shape"])) * dtype.itemsize
+        data = raw[layout["offset"]:layout["offset"] + nbytes].view(dtype).reshape(layout["shape"])
+        targets = {name: unpack_target(raw[t["offset"]:t["offset"] + t["nbytes"]], t)
+                   for name, t in layout["targets"].items()}
+        return data, targets
+
+    def __getitem__(self, record):
+        return self.get(record)
+
+    def __iter__(self):
+        for record in range(len(self.records)):
+            yield self.get(record)
+
+    @property
+    def num_slices(self):
+        """Total slices over all slice-layout records."""
+        return int(self._starts()[-1])
+
+    def _starts(self):
+        if self._slice_starts is None:
+            counts = [r["shape"][0] if r["layout"] == "slice" else 0 for r in self.records]
+            self._slice_starts = np.concatenate([[0], np.cumsum(counts)])
+        return self._slice_starts
+
+    def get_slice(self, index):
+        """
+        Return slice `index` counted over all slice-layout records, its record number and its targets.
+
+        Targets the record lists as indexed by output slice are reduced to this slice's
+        value (per timepoint on 4D series); the others are those of the whole volume.
+        """
+        starts = self._starts()
+        if not 0 <= index < starts[-1]:
+            raise IndexError(f"slice {index} out of range for {starts[-1]} slices")
+        record = int(np.searchsorted(starts, index, side="right")) - 1
+        position = index - starts[record]
+        data, targets = self.get(record)
+        n = data.shape[0]
+        per_slice = self.records[record].get("slice_targets", ())
+        targets = {name: value[..., position] if name in per_slice and np.ndim(value) and value.shape[-1] == n else value
+                   for name, value in targets.items()}
+        return data[position], record, targets
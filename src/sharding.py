@@ -0,0 +1,180 @@
+import argparse
+import heapq
+import json
+import os
+import shutil
+from pathlib import Path
+
+from results_io import ResultsWriter, read_results
+from shard_store import INDEX_NAME, ShardReader, ShardWriter
+from targets_store import TargetsReader, TargetsWriter
+
+SHARD_INFO = "shard.json"
+
+
+def parse_shard(value):
+    """Parse an `i/N` shard spec (0 <= i < N) into `(i, N)`; usable as an argparse type."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must satisfy 0 <= i < N, got {value!r}")
+    return index, count
+
+
+def partition_files(file_paths, count):
+    """
+    Split files into `count` shards of roughly equal total size.
+
+    Files are placed largest first on the currently lightest shard (ties go to the lower
+    shard index), ordered by size and then name, so every node computes the same partition
+    whatever order the directory is listed in. Each shard's files are returned sorted by name.
+    """
+    sizes = {path: os.path.getsize(path) for path in file_paths}
+    ordered = sorted(file_paths, key=lambda path: (-sizes[path], os.path.basename(path)))
+    loads = [(0, shard) for shard in range(count)]
+    shards = [[] for _ in range(count)]
+    for path in ordered:
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(path)
+        heapq.heappush(loads, (load + sizes[path], shard))
+    return [sorted(files, key=os.path.basename) for files in shards]
+
+
+def _relative(path, base):
+    """`path` relative to `base` when it lies inside it, so shard directories can be moved; else absolute."""
+    path, base = os.path.abspath(path), os.path.abspath(base)
+    return os.path.relpath(path, base) if os.path.commonpath([path, base]) == base else path
+
+
+def write_shard_info(output_dir, index, count, all_files, shard_files, run_seed, results_path, manifest_path, gif_dir):
+    """Record which inputs a shard owns and where its results went, for `merge_shards`."""
+    info = {
+        "shard": index,
+        "count": count,
+        "total_files": len(all_files),
+        "files": [os.path.basename(path) for path in shard_files],
+        "bytes": sum(os.path.getsize(path) for path in shard_files),
+        "run_seed": run_seed,
+        "results": _relative(results_path, output_dir),
+        "manifest": _relative(manifest_path, output_dir),
+        "gif_dir": _relative(gif_dir, output_dir),
+    }
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(output_dir, SHARD_INFO), "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def _transfer(source, destination, copy):
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    if copy:
+        if os.path.isdir(source):
+            shutil.copytree(source, destination, dirs_exist_ok=True)
+        else:
+            shutil.copy2(source, destination)
+    else:
+        shutil.move(source, destination)
+
+
+def merge_shards(shard_dirs, output_dir, copy=False, shard_size=1 << 30):
+    """
+    Combine the result files and outputs of every shard of a run into `output_dir`.
+
+    Checks that the shards form one complete partition (same N, each index exactly once,
+    disjoint files) and that every input of every shard is recorded as done in its run
+    manifest, then writes one results file (plus binary targets and `--save_type shards`
+    records, re-packed into `shard_size` byte shards) and moves (or copies) outputs and
+    GIFs over, rewriting `output_path`. Raises ValueError when the counts do not add up.
+    Returns a summary dict, also saved as `merge_summary.json`.
+    """
+    infos = []
+    for shard_dir in shard_dirs:
+        with open(os.path.join(shard_dir, SHARD_INFO)) as f:
+            infos.append((shard_dir, json.load(f)))
+    infos.sort(key=lambda item: item[1]["shard"])
+
+    counts = {info["count"] for _, info in infos}
+    if len(counts) != 1:
+        raise ValueError(f"Shards come from runs split into different counts: {sorted(counts)}")
+    count = counts.pop()
+    indices = [info["shard"] for _, info in infos]
+    if indices != list(range(count)):
+        raise ValueError(f"Expected shards 0..{count - 1} once each, got {indices}")
+    owned = [name for _, info in infos for name in info["files"]]
+    if len(owned) != len(set(owned)):
+        raise ValueError("Shards overlap: some inputs appear in more than one shard")
+    total_files = infos[0][1]["total_files"]
+    if len(owned) != total_files:
+        raise ValueError(f"Shards own {len(owned)} inputs but the run had {total_files}")
+    if len({info["run_seed"] for _, info in infos}) > 1:
+        print("Warning: shards ran with different run seeds; pass the same --seed to every shard for one reproducible run")
+
+    # Verify every shard before anything is moved
+    shard_entries, missing = [], []
+    for shard_dir, info in infos:
+        done = {record["file"]: record["entries"] for record in read_results(os.path.join(shard_dir, info["manifest"]))}
+        missing.extend(name for name in info["files"] if name not in done)
+        entries = read_results(os.path.join(shard_dir, info["results"]))
+        recorded = sum(done.get(name, 0) for name in info["files"])
+        if len(entries) != recorded:
+            raise ValueError(f"Shard {info['shard']} has {len(entries)} result entries but its manifest records {recorded}")
+        shard_entries.append(entries)
+    if missing:
+        raise ValueError(f"{len(missing)} of {total_files} inputs have no completed results: {missing}")
+
+    results_path = os.path.join(output_dir, "multi_analysis_results.jsonl")
+    if os.path.exists(results_path):
+        raise ValueError(f"{results_path} already exists; merge into an empty directory")
+    gif_dir = os.path.join(output_dir, "gifs")
+    targets_writer = None
+    shard_writer = None
+    with ResultsWriter(results_path) as writer:
+        for (shard_dir, info), entries in zip(infos, shard_entries):
+            targets_path = os.path.splitext(os.path.join(shard_dir, info["results"]))[0] + "_targets.bin"
+            reader = TargetsReader(targets_path) if os.path.exists(targets_path) else None
+            if reader is not None and targets_writer is None:
+                targets_writer = TargetsWriter(os.path.splitext(results_path)[0] + "_targets.bin")
+            shards_dir = os.path.join(shard_dir, "shards")
+            shard_reader = ShardReader(shards_dir) if os.path.exists(os.path.join(shards_dir, INDEX_NAME)) else None
+            if shard_reader is not None and shard_writer is None:
+                shard_writer = ShardWriter(os.path.join(output_dir, "shards"), shard_size)
+
+            for entry in entries:
+                if "output_path" in entry:
+                    # Outputs are written straight into the shard's --o directory
+                    name = os.path.basename(entry["output_path"])
+                    _transfer(os.path.join(shard_dir, name), os.path.join(output_dir, name), copy)
+                    entry["output_path"] = os.path.join(output_dir, name)
+                if reader is not None and "targets_ref" in entry:
+                    entry["targets_ref"] = targets_writer.write(reader[entry["targets_ref"]["record"]])
+                if shard_reader is not None and "shard_ref" in entry:
+                    entry["shard_ref"] = shard_writer.copy_from(shard_reader, entry["shard_ref"]["record"])
+                writer.write(entry)
+
+            shard_gifs = os.path.join(shard_dir, info["gif_dir"])
+            if os.path.isdir(shard_gifs):
+                for name in sorted(os.listdir(shard_gifs)):
+                    _transfer(os.path.join(shard_gifs, name), os.path.join(gif_dir, name), copy)
+    if targets_writer is not None:
+        targets_writer.close()
+    if shard_writer is not None:
+        shard_writer.close()
+
+    total_entries = sum(len(entries) for entries in shard_entries)
+    summary = {"shards": count, "files": total_files, "entries": total_entries, "results": results_path}
+    with open(os.path.join(output_dir, "merge_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Merged {count} shards: {total_files} files, {total_entries} entries into {results_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the outputs of a multi_img run split with --shard i/N.")
+    parser.add_argument("shards", nargs="+", help="Output directories (--o) of every shard")
+    parser.add_argument("--o", type=str, required=True, help="Directory of the merged dataset")
+    parser.add_argument("--copy", action="store_true", default=False, help="Copy outputs instead of moving them")
+    parser.add_argument("--shard_size", type=float, default=1024, help="MB per shard file of merged --save_type shards datasets")
+    args = parser.parse_args()
+    merge_shards(args.shards, args.o, copy=args.copy, shard_size=int(args.shard_size * 2 ** 20))
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class SimulatedVolume:
+    """
+    Lazy view of a simulated volume.
+
+    Holds the simulator (and through it the source array), the output slot map along `axis`
+    and the mixed_axis recipes the extra slots point to. Indexing with ints, slices, Ellipsis
+    or an index array along `axis` gathers only the selected slices; `np.asarray(view)` or
+    `materialize()` builds the full array, in the compute dtype the view was created with.
+    """
+
+    def __init__(self, simulator, slot_map, recipes, axis):
+        self.simulator = simulator
+        self.slot_map = np.asarray(slot_map)
+        self.recipes = recipes
+        self.axis = axis
+        shape = list(simulator.original_shape)
+        shape[axis] = len(self.slot_map)
+        self.shape = tuple(shape)
+        self.dtype = simulator.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"SimulatedVolume(shape={self.shape}, axis={self.axis}, replaced={len(self.recipes)})"
+
+    def _expand_key(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is None for k in key):
+            raise IndexError("SimulatedVolume does not support np.newaxis")
+        ellipses = [i for i, k in enumerate(key) if k is Ellipsis]
+        if len(ellipses) > 1:
+            raise IndexError("an index can only have a single ellipsis ('...')")
+        if ellipses:
+            at = ellipses[0]
+            key = key[:at] + (slice(None),) * (self.ndim - len(key) + 1) + key[at + 1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices: volume is {self.ndim}-dimensional")
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __getitem__(self, key):
+        key = self._expand_key(key)
+        positions = np.arange(self.shape[self.axis])[key[self.axis]]
+        with self.simulator._computing_in(self.dtype):
+            block = self.simulator._gather_slab(self.slot_map[np.atleast_1d(positions)], self.recipes, self.axis)
+        rest = list(key)
+        rest[self.axis] = 0 if np.ndim(positions) == 0 else slice(None)
+        return block[tuple(rest)]
+
+    def materialize(self):
+        """Build the full simulated volume."""
+        with self.simulator._computing_in(self.dtype):
+            return self.simulator._gather_slab(self.slot_map, self.recipes, self.axis)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.materialize()
+        return data if dtype is None else data.astype(dtype, copy=False)
@@ -1,30 +1,311 @@
 import nibabel as nib
 import numpy as np
-import imageio
 import random
 import os
-import scipy.ndimage as ndi
-import matplotlib.pyplot as plt
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from gif_visualizer import slices_to_uint8, montage
+from profiler import PROFILER
+from simulated_volume import SimulatedVolume
+
+COMPUTE_DTYPES = ("native", "float32", "float64")
+# Largest request read slab-wise through a non-memory-mapped proxy; bigger ones decode the volume once,
+# since every proxy read of a gzip stream decompresses it again from the start.
+_PROXY_SLICE_READS = 4
+
+def _plane_shape(shape, axis):
+    """Shape of a 2D slice taken along `axis`."""
+    return tuple(n for a, n in enumerate(shape) if a != axis)
+
+
+@lru_cache(maxsize=None)
+def _linear_zoom_matrix(n_in, n_out):
+    """
+    Matrix that linearly resamples a length-`n_in` axis to `n_out` samples.
+
+    Matches `scipy.ndimage.zoom(..., order=1)`: the first and last samples of both
+    grids are aligned and each output sample mixes its two nearest input samples.
+    """
+    scale = (n_in - 1) / (n_out - 1) if n_out > 1 else 1.0
+    coords = np.minimum(np.arange(n_out) * scale, n_in - 1)
+    lower = np.floor(coords).astype(int)
+    upper = np.minimum(lower + 1, n_in - 1)
+    weight = coords - lower
+
+    matrix = np.zeros((n_out, n_in))
+    rows = np.arange(n_out)
+    np.add.at(matrix, (rows, lower), 1 - weight)
+    np.add.at(matrix, (rows, upper), weight)
+    return matrix
+
+
+@lru_cache(maxsize=None)
+def _resampling_operators(source_shape, target_shape, dtype="float64"):
+    """Row and column operators taking a `source_shape` slice to `target_shape`; cached per shape pair and dtype."""
+    return (_linear_zoom_matrix(source_shape[0], target_shape[0]).astype(dtype),
+            _linear_zoom_matrix(source_shape[1], target_shape[1]).astype(dtype))
+
+
+def _resample_stack(slices, row_op, col_op):
+    """Resample a stack of (n, rows, cols[, timepoints]) slices with a pair of operators."""
+    if slices.ndim == 3:
+        return row_op @ slices @ col_op.T
+    # 4D series: move the timepoints ahead of the plane so one matmul covers every volume
+    planes = np.moveaxis(slices, 3, 1)
+    return np.moveaxis(row_op @ planes @ col_op.T, 1, 3)
+
+
+def _cast(values, dtype):
+    """Cast `values` to `dtype`, rounding and clipping floats into range for integer dtypes."""
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu' and values.dtype.kind == 'f':
+        info = np.iinfo(dtype)
+        values = np.clip(np.rint(values), info.min, info.max)
+    return values.astype(dtype, copy=False)
+
+
+def _rng(rng):
+    """Source of random draws: the given `np.random.Generator`, or the global NumPy state when None."""
+    return np.random if rng is None else rng
+
+
+def _integer(rng, high):
+    """One random integer in [0, high) from a Generator or the global NumPy state."""
+    return rng.integers(high) if isinstance(rng, np.random.Generator) else rng.randint(high)
+
+
+def _simulation_rngs(rng, mode, count):
+    """
+    One generator per simulation: independent simulations each draw from their own child of
+    `rng` (so any one of them can be replayed alone); other modes share `rng`.
+    """
+    if rng is None or mode != "independent":
+        return [rng] * count
+    return rng.spawn(count)
+
+
+def _write_gzip(raw, output_path, compresslevel=1, threads=None, block_size=8 * 2 ** 20):
+    """
+    Gzip `raw` bytes to `output_path`, compressing `block_size` blocks on a thread pool.
+
+    Each block becomes its own gzip member; concatenated members form a valid gzip file
+    that nibabel, zlib-based readers and `gunzip` read as one stream.
+    """
+    from concurrent.futures import ThreadPoolExecutor  # deferred: keeps the import of NeuroGlitch light
+
+    view = memoryview(raw)
+    blocks = [view[i:i + block_size] for i in range(0, len(view), block_size)] or [view]
+
+    def compress(block):
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        return compressor.compress(block) + compressor.flush()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool, open(output_path, 'wb') as f:
+        for member in pool.map(compress, blocks):
+            f.write(member)
+
+
+def _open_nifti_memmap(output_path, shape, dtype, affine):
+    """Create an uncompressed NIfTI file of `shape` and return its data block as a writable memmap."""
+    header = nib.Nifti1Image(np.empty((1,) * len(shape), dtype=dtype), affine).header
+    header.set_data_shape(shape)
+    header['vox_offset'] = offset = 352  # 348-byte header plus the 4-byte extension flag
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(output_path, 'wb') as f:
+        f.write(header.binaryblock + b'\0' * 4)
+        f.truncate(offset + nbytes)
+    return np.memmap(output_path, dtype=header.get_data_dtype(), mode='r+', offset=offset, shape=tuple(shape), order='F')
+
+
+def _choose_rows(n, k, rows, rng=None):
+    """Draw `k` distinct indices out of `n` for each of `rows` samples in one vectorized call."""
+    return np.argsort(_rng(rng).random((rows, n)), axis=1)[:, :k]
+
 
 class ArtifactSimulator:
     """
     A class to simulate common issues in 3D NIfTI files, such as missing slides,
     incorrect sequences, and mixed axis simulations along a user-specified axis.
+
+    4D series (x, y, z, time) are supported: slice axes stay 0-2 and every artifact is
+    applied to all timepoints at once, or per timepoint with `simulate(..., per_timepoint=True)`.
+
+    `compute_dtype` sets the dtype volumes are decoded and simulated in: "float64" (the
+    default, what `get_fdata()` returns), "float32", or "native" for the on-disk dtype.
+    Reindexing artifacts only move slices, so they are exact in any dtype; mixed_axis
+    resampling runs in float32 unless the compute dtype is float64, and its results are
+    rounded back into integer dtypes.
     """
 
-    def __init__(self, file_path):
-        """Initialize the simulator by loading a NIfTI file."""
-        self.nifti_img = nib.load(file_path)
-        self.original_data = self.nifti_img.get_fdata()
-        self.original_shape = self.original_data.shape
+    def __init__(self, file_path, lazy=False, cache=None, compute_dtype="float64"):
+        """
+        Initialize the simulator from a NIfTI file.
+
+        With `lazy=True` only the header is read up front. Uncompressed `.nii` files are
+        memory-mapped, slices are read on demand through `get_slices`, and the full
+        decode is deferred until `original_data` is first accessed.
+
+        With a `volume_cache.VolumeCache`, a cached volume is opened memory-mapped without
+        touching the source; on a miss the volume is decoded and stored in the cache.
+        Entries are kept per compute dtype.
+        """
+        self.lazy = lazy
+        self.compute_dtype = compute_dtype
+        self._data = None
+        self._mmap = None
+        self._mmap_scaling = (1.0, 0.0)
+        if cache is not None:
+            cached = cache.get(file_path, dtype=compute_dtype)
+            if cached is None:
+                self.nifti_img = nib.load(file_path, mmap=True)
+                self.dtype = self._resolve_dtype(compute_dtype)
+                with PROFILER.stage("decode"):
+                    self._data = self._decode()
+                with PROFILER.stage("cache_write"):
+                    cache.put(file_path, self.nifti_img, self._data, dtype=compute_dtype)
+            else:
+                self.nifti_img = cached
+                self._data = np.asanyarray(cached.dataobj)
+                self.dtype = self._data.dtype
+            self.original_shape = self._check_shape(self.nifti_img.shape)
+            return
+
+        self.nifti_img = nib.load(file_path, mmap=True)
+        self.original_shape = self._check_shape(self.nifti_img.shape)
+        self.dtype = self._resolve_dtype(compute_dtype)
+        if not lazy:
+            with PROFILER.stage("decode"):
+                self._data = self._decode()
+        elif not str(file_path).endswith('.gz'):
+            # Map the raw on-disk values; read scaling, if any, is applied to the gathered slices only.
+            raw = self.nifti_img.dataobj.get_unscaled()
+            if isinstance(raw, np.memmap):
+                self._mmap = raw
+                self._mmap_scaling = self._source_scaling()
+
+    @staticmethod
+    def _check_shape(shape):
+        if len(shape) not in (3, 4):
+            raise ValueError(f"Expected a 3D volume or a 4D series, got shape {tuple(shape)}")
+        return tuple(shape)
+
+    def _source_scaling(self):
+        """Read scaling `(slope, inter)` of the source; nibabel moves it from the header onto the data proxy."""
+        slope = getattr(self.nifti_img.dataobj, 'slope', None)
+        inter = getattr(self.nifti_img.dataobj, 'inter', None)
+        if slope is None:
+            slope, inter = self.nifti_img.header.get_slope_inter()
+        slope = 1.0 if slope is None or np.isnan(slope) else float(slope)
+        inter = 0.0 if inter is None or np.isnan(inter) else float(inter)
+        return slope, inter
+
+    def _resolve_dtype(self, compute_dtype):
+        """NumPy dtype of a COMPUTE_DTYPES name for this volume."""
+        if compute_dtype == "native":
+            if self._source_scaling() == (1.0, 0.0):
+                return self.nifti_img.header.get_data_dtype()
+            return np.dtype(np.float32)  # scaled values have no exact on-disk representation
+        if compute_dtype in ("float32", "float64"):
+            return np.dtype(compute_dtype)
+        raise ValueError(f"Unknown compute_dtype: {compute_dtype}, expected one of {COMPUTE_DTYPES}")
+
+    def _decode(self):
+        """Decode the full volume in the compute dtype."""
+        if self.dtype.kind == 'f':
+            return self.nifti_img.get_fdata(dtype=self.dtype)
+        return np.asanyarray(self.nifti_img.dataobj)  # unscaled native data needs no conversion
+
+    @property
+    def _resample_dtype(self):
+        """Dtype mixed_axis resampling runs in: float64 only when computing in float64."""
+        return np.dtype(np.float64) if self.dtype == np.float64 else np.dtype(np.float32)
+
+    @contextmanager
+    def _computing_in(self, dtype):
+        """Temporarily compute in another NumPy dtype; the decoded volume is converted slice by slice."""
+        previous = self.dtype
+        self.dtype = np.dtype(dtype)
+        try:
+            yield
+        finally:
+            self.dtype = previous
+
+    @property
+    def original_data(self):
+        """Full volume, decoded on first access in lazy mode."""
+        if self._data is None:
+            with PROFILER.stage("decode"):
+                self._data = self._decode()
+            self._mmap = None
+        return self._data
+
+    def _from_mmap(self, raw):
+        """Scale raw values read from the memory-mapped source and convert them to the compute dtype."""
+        slope, inter = self._mmap_scaling
+        if (slope, inter) != (1.0, 0.0):
+            raw = raw * slope + inter
+        return _cast(raw, self.dtype)
+
+    def get_slices(self, indices, axis):
+        """
+        Return the original slices `indices` along `axis`.
+
+        When lazy, a memory-mapped source is read slice by slice. Other sources (e.g. `.nii.gz`)
+        serve a few slices from one bounding slab read through the proxy and decode the volume
+        once for larger requests.
+        """
+        indices = np.asarray(indices, dtype=int)
+        # Index rather than np.take: take copies a Fortran-ordered volume whole before gathering.
+        index = (slice(None),) * axis + (indices,)
+        if self._data is None and self._mmap is None and len(np.unique(indices)) > _PROXY_SLICE_READS:
+            return self.original_data[index].astype(self.dtype, copy=False)  # decodes once and keeps the volume
+        if self._data is not None:
+            return self._data[index].astype(self.dtype, copy=False)
+        if self._mmap is not None:
+            return self._from_mmap(self._mmap[index])
+
+        if len(indices) == 0:
+            out_shape = list(self.original_shape)
+            out_shape[axis] = 0
+            return np.empty(out_shape, dtype=self.dtype)
+        low = int(indices.min())
+        slab = np.asarray(self.nifti_img.dataobj[(slice(None),) * axis + (slice(low, int(indices.max()) + 1),)])
+        return slab[(slice(None),) * axis + (indices - low,)].astype(self.dtype, copy=False)
+
+    def get_slice(self, axis, index):
+        """Return a single 2D slice of the original volume."""
+        return np.squeeze(self.get_slices([index], axis), axis=axis)
+
+    def _original_copy(self):
+        """Writable copy of the original volume in the compute dtype that does not keep a decoded cache alive."""
+        if self._data is not None:
+            return self._data.astype(self.dtype)
+        return np.asarray(self.nifti_img.dataobj, dtype=self.dtype)
+
+    def _resize_slices(self, slices, aux_axis, target_shape):
+        """Resample a stack of slices taken along `aux_axis` to `target_shape`, returned in the compute dtype."""
+        dtype = self._resample_dtype
+        row_op, col_op = _resampling_operators(_plane_shape(self.original_shape[:3], aux_axis), tuple(target_shape), dtype.name)
+        return _cast(_resample_stack(slices.astype(dtype, copy=False), row_op, col_op), self.dtype)
+
+    def _source_dtype_image(self, data):
+        """NIfTI image of `data` stored in the source's on-disk dtype with the source's scaling and header."""
+        header = self.nifti_img.header.copy()
+        dtype = header.get_data_dtype()
+        slope, inter = self._source_scaling()
+
+        raw = (data - inter) / slope if (slope, inter) != (1.0, 0.0) else data
+        img = type(self.nifti_img)(_cast(raw, dtype), self.nifti_img.affine, header)
+        img.header.set_slope_inter(slope, inter)
+        return img
 
     def clear_state(self):
         """Reset the simulator state to the original data."""
         pass  # No persistent state to clear in this implementation
 
-    def simulate_missing_slides(self, data, remove_param, axis=0):
-        print(f'remove_param: {remove_param}')
-        num_slices = data.shape[axis]
+    def _plan_missing_slides(self, num_slices, remove_param, variants=None, rng=None):
+        """Draw the slice indices removed by missing_slides (one row per variant if `variants` is given)."""
         if isinstance(remove_param, int):
             k = remove_param
         elif isinstance(remove_param, float) and 0 <= remove_param <= 1:
@@ -35,8 +316,49 @@ class ArtifactSimulator:
         if k >= num_slices:
             raise ValueError("Cannot remove all or more slides than available along the axis")
 
-        remove_indices = np.random.choice(num_slices, size=k, replace=False)
-        simulated_data = np.delete(data, remove_indices, axis=axis)
+        if variants is not None:
+            return _choose_rows(num_slices, k, variants, rng)
+        return _rng(rng).choice(num_slices, size=k, replace=False)
+
+    def _plan_wrong_sequence(self, num_slices, shuffle_param=None, variants=None, rng=None):
+        """Draw the slice order produced by wrong_sequence (one row per variant if `variants` is given)."""
+        rng = _rng(rng)
+        if shuffle_param is None:
+            if variants is not None:
+                return _choose_rows(num_slices, num_slices, variants, rng)
+            return rng.permutation(num_slices)
+
+        if isinstance(shuffle_param, int):
+            m = shuffle_param
+        elif isinstance(shuffle_param, float) and 0 <= shuffle_param <= 1:
+            m = int(shuffle_param * num_slices)
+        else:
+            raise ValueError("shuffle_param must be an integer, float between 0 and 1, or None")
+
+        if m > num_slices:
+            raise ValueError("Cannot shuffle more slides than available along the axis")
+
+        if variants is not None:
+            shuffle_indices = _choose_rows(num_slices, m, variants, rng)
+            shuffled_subset = np.take_along_axis(shuffle_indices, _choose_rows(m, m, variants, rng), axis=1)
+            shuffled_indices = np.tile(np.arange(num_slices), (variants, 1))
+            np.put_along_axis(shuffled_indices, shuffle_indices, shuffled_subset, axis=1)
+            return shuffled_indices
+
+        shuffle_indices = rng.choice(num_slices, size=m, replace=False)
+        shuffled_indices = np.arange(num_slices)
+        shuffled_subset = rng.permutation(shuffle_indices)
+        shuffled_indices[shuffle_indices] = shuffled_subset
+        return shuffled_indices
+
+    def simulate_missing_slides(self, data, remove_param, axis=0, rng=None):
+        print(f'remove_param: {remove_param}')
+        num_slices = self.original_shape[axis] if data is None else data.shape[axis]
+        remove_indices = self._plan_missing_slides(num_slices, remove_param, rng=rng)
+        if data is None:
+            simulated_data = self.get_slices(np.delete(np.arange(num_slices), remove_indices), axis)
+        else:
+            simulated_data = np.delete(data, remove_indices, axis=axis)
 
         simulation_info = {
             'type': 'missing_slides',
@@ -44,27 +366,13 @@ class ArtifactSimulator:
         }
         return simulated_data, simulation_info
 
-    def simulate_wrong_sequence(self, data, shuffle_param=None, axis=0):
-        num_slices = data.shape[axis]
-        if shuffle_param is None:
-            shuffled_indices = np.random.permutation(num_slices)
+    def simulate_wrong_sequence(self, data, shuffle_param=None, axis=0, rng=None):
+        num_slices = self.original_shape[axis] if data is None else data.shape[axis]
+        shuffled_indices = self._plan_wrong_sequence(num_slices, shuffle_param, rng=rng)
+        if data is None:
+            simulated_data = self.get_slices(shuffled_indices, axis)
         else:
-            if isinstance(shuffle_param, int):
-                m = shuffle_param
-            elif isinstance(shuffle_param, float) and 0 <= shuffle_param <= 1:
-                m = int(shuffle_param * num_slices)
-            else:
-                raise ValueError("shuffle_param must be an integer, float between 0 and 1, or None")
-
-            if m > num_slices:
-                raise ValueError("Cannot shuffle more slides than available along the axis")
-
-            shuffle_indices = np.random.choice(num_slices, size=m, replace=False)
-            shuffled_indices = np.arange(num_slices)
-            shuffled_subset = np.random.permutation(shuffle_indices)
-            shuffled_indices[shuffle_indices] = shuffled_subset
-
-        simulated_data = np.take(data, shuffled_indices, axis=axis)
+            simulated_data = np.take(data, shuffled_indices, axis=axis)
 
         simulation_info = {
             'type': 'wrong_sequence',
@@ -72,7 +380,16 @@ class ArtifactSimulator:
         }
         return simulated_data, simulation_info
 
-    def simulate_mixed_axis(self, data, axis_list, weight_param):
+    def _plan_mixed_axis(self, data_shape, axis_list, weight_param, variants=None, rng=None, materialize=True):
+        """
+        Draw the positions replaced by mixed_axis and build their resized auxiliary-axis slices.
+
+        Returns the main axis, the replaced positions, the per-position source axis and a
+        dict mapping each replaced position to its new slice. With `variants`, the positions
+        and source axes gain a leading variant dimension and one dict is returned per variant.
+        With `materialize=False` the dicts map positions to `(aux_axis, source_index)` recipes,
+        resampled later by `_resample_slices`.
+        """
         if not isinstance(axis_list, list) or len(axis_list) < 1 or len(axis_list) > 3:
             raise ValueError("axis_list must be a list of 1 to 3 integers between 0 and 2")
         axis_list = list(set(axis_list))
@@ -81,7 +398,7 @@ class ArtifactSimulator:
 
         main_axis = axis_list[0]
         aux_axes = axis_list[1:] if len(axis_list) > 1 else []
-        num_slices = data.shape[main_axis]
+        num_slices = data_shape[main_axis]
 
         if isinstance(weight_param, int):
             num_replace = weight_param
@@ -92,55 +409,247 @@ class ArtifactSimulator:
         if num_replace > num_slices:
             raise ValueError("Cannot replace more slides than available")
 
-        replace_indices = np.random.choice(num_slices, size=num_replace, replace=False)
-        simulated_data = data.copy()
-        axis_source = np.full(num_slices, main_axis)
-
-        for i in replace_indices:
-            if aux_axes:
-                aux_axis = np.random.choice(aux_axes)
-                j = np.random.randint(self.original_data.shape[aux_axis])
-                if aux_axis == 0:
-                    slice_data = self.original_data[j, :, :]
-                elif aux_axis == 1:
-                    slice_data = self.original_data[:, j, :]
-                elif aux_axis == 2:
-                    slice_data = self.original_data[:, :, j]
-
-                if main_axis == 0:
-                    target_shape = data.shape[1:]
-                elif main_axis == 1:
-                    target_shape = (data.shape[0], data.shape[2])
-                elif main_axis == 2:
-                    target_shape = data.shape[:2]
-
-                if aux_axis == 0:
-                    source_shape = self.original_data.shape[1:]
-                elif aux_axis == 1:
-                    source_shape = (self.original_data.shape[0], self.original_data.shape[2])
-                elif aux_axis == 2:
-                    source_shape = self.original_data.shape[:2]
-
-                zoom_factors = (target_shape[0] / source_shape[0], target_shape[1] / source_shape[1])
-                resized_slice = ndi.zoom(slice_data, zoom_factors, order=1)
-
-                if main_axis == 0:
-                    simulated_data[i, :, :] = resized_slice
-                elif main_axis == 1:
-                    simulated_data[:, i, :] = resized_slice
-                elif main_axis == 2:
-                    simulated_data[:, :, i] = resized_slice
-
-                axis_source[i] = aux_axis
+        rng = _rng(rng)
+        if variants is not None:
+            replace_indices = _choose_rows(num_slices, num_replace, variants, rng)
+        else:
+            replace_indices = rng.choice(num_slices, size=num_replace, replace=False)
+        rows = np.atleast_2d(replace_indices)
+        axis_source = np.full((len(rows), num_slices), main_axis)
+        replaced = [{} for _ in rows]
+
+        if aux_axes and num_replace > 0:
+            if variants is not None:
+                aux = rng.choice(aux_axes, size=rows.shape)
+                source_index = (rng.random(rows.shape) * np.array(self.original_shape)[aux]).astype(int)
+            else:
+                aux = np.empty_like(rows)
+                source_index = np.empty_like(rows)
+                for n in range(num_replace):
+                    aux[0, n] = rng.choice(aux_axes)
+                    source_index[0, n] = _integer(rng, self.original_shape[aux[0, n]])
+            np.put_along_axis(axis_source, rows, aux, axis=1)
+
+            # Every auxiliary axis shares one pair of resampling operators, applied to all its slices at once.
+            target_shape = _plane_shape(data_shape, main_axis)
+            for aux_axis in aux_axes:
+                variant, pos = np.nonzero(aux == aux_axis)
+                if len(variant) == 0:
+                    continue
+                if not materialize:
+                    for v, p in zip(variant, pos):
+                        replaced[v][rows[v, p]] = (int(aux_axis), int(source_index[v, p]))
+                    continue
+                slices = np.moveaxis(self.get_slices(source_index[variant, pos], aux_axis), aux_axis, 0)
+                resized = self._resize_slices(slices, aux_axis, target_shape)
+                for n, (v, p) in enumerate(zip(variant, pos)):
+                    replaced[v][rows[v, p]] = resized[n]
+
+        if variants is not None:
+            return main_axis, replace_indices, axis_source, replaced
+        return main_axis, replace_indices, axis_source[0], replaced[0]
+
+    def _resample_slices(self, recipes, target_shape):
+        """Resample `(aux_axis, source_index)` recipes of mixed_axis into slices of `target_shape`."""
+        recipes = np.asarray(recipes, dtype=int).reshape(-1, 2)
+        out = np.empty((len(recipes),) + tuple(target_shape), dtype=self.dtype)
+        for aux_axis in np.unique(recipes[:, 0]):
+            picked = np.flatnonzero(recipes[:, 0] == aux_axis)
+            slices = np.moveaxis(self.get_slices(recipes[picked, 1], aux_axis), aux_axis, 0)
+            out[picked] = self._resize_slices(slices, aux_axis, target_shape)
+        return out
+
+    def simulate_mixed_axis(self, data, axis_list, weight_param, rng=None):
+        data_shape = self.original_shape if data is None else data.shape
+        main_axis, replace_indices, axis_source, replaced = self._plan_mixed_axis(data_shape, axis_list, weight_param, rng=rng)
+
+        simulated_data = self._original_copy() if data is None else data.copy()
+        slices = np.moveaxis(simulated_data, main_axis, 0)
+        for i, resized_slice in replaced.items():
+            slices[i] = resized_slice
 
         simulation_info = {
             'type': 'mixed_axis',
             'axis_source': axis_source,
-            'mixed_positions': replace_indices
+            'mixed_positions': replace_indices,
+            'main_axis': main_axis,
+            'replaced': replaced
         }
         return simulated_data, simulation_info
 
-    def simulate(self, simulations, chain=False, mode="independent", save_type=None, output_path=None):
+    def _draw_variant_infos(self, sim, variants, rng=None, materialize=True):
+        """
+        Draw the random choices of one simulation on the original volume for all variants at once.
+
+        With `materialize=False` mixed_axis replacements are kept as `(aux_axis, source_index)` recipes.
+        """
+        sim_type = sim['type']
+        if sim_type == 'missing_slides':
+            remove = self._plan_missing_slides(self.original_shape[sim['axis']], sim['remove_param'], variants, rng)
+            return [{'type': sim_type, 'remove_indices': r} for r in remove]
+        elif sim_type == 'wrong_sequence':
+            shuffled = self._plan_wrong_sequence(self.original_shape[sim['axis']], sim['shuffle_param'], variants, rng)
+            return [{'type': sim_type, 'shuffled_indices': s} for s in shuffled]
+        elif sim_type == 'mixed_axis':
+            main_axis, replace, axis_source, replaced = self._plan_mixed_axis(self.original_shape, sim['axis_list'], sim['weight_param'],
+                                                                               variants, rng, materialize)
+            return [{'type': sim_type, 'axis_source': axis_source[v], 'mixed_positions': replace[v],
+                     'main_axis': main_axis, 'replaced': replaced[v]} for v in range(variants)]
+        raise ValueError(f"Unknown simulation type: {sim_type}")
+
+    def _simulate_one(self, sim, sim_info=None, rng=None):
+        """
+        Apply one simulation to the original volume and build its targets.
+
+        Random choices are drawn here unless pre-drawn `sim_info` is given. Returns the
+        simulated data, the targets and the axis used for saving.
+        """
+        sim_type = sim['type']
+        if sim_type in ['missing_slides', 'wrong_sequence']:
+            axis = sim['axis']
+        else:
+            axis = sim['axis_list'][0]
+
+        if sim_type == 'missing_slides':
+            if sim_info is None:
+                simulated_data, sim_info = self.simulate_missing_slides(None, sim['remove_param'], axis, rng)
+            else:
+                simulated_data = self.get_slices(np.delete(np.arange(self.original_shape[axis]), sim_info['remove_indices']), axis)
+        elif sim_type == 'wrong_sequence':
+            if sim_info is None:
+                simulated_data, sim_info = self.simulate_wrong_sequence(None, sim['shuffle_param'], axis, rng)
+            else:
+                simulated_data = self.get_slices(sim_info['shuffled_indices'], axis)
+        elif sim_type == 'mixed_axis':
+            if sim_info is None:
+                simulated_data, sim_info = self.simulate_mixed_axis(None, sim['axis_list'], sim['weight_param'], rng)
+            else:
+                simulated_data = self._original_copy()
+                slices = np.moveaxis(simulated_data, sim_info['main_axis'], 0)
+                for i, resized_slice in sim_info['replaced'].items():
+                    slices[i] = resized_slice
+        else:
+            raise ValueError(f"Unknown simulation type: {sim_type}")
+
+        return simulated_data, self._single_targets(sim_info, axis), axis
+
+    def _single_targets(self, sim_info, axis):
+        """Build the targets of one simulation applied to the original volume from its drawn choices."""
+        N = self.original_shape[axis]
+        if sim_info['type'] == 'missing_slides':
+            targets = {
+                'is_missing': 1 if len(sim_info['remove_indices']) > 0 else 0,
+                'missing_positions': sim_info['remove_indices'],
+                'presence_target': np.ones(N, dtype=int),
+                'sequence_target': np.setdiff1d(np.arange(N), sim_info['remove_indices'])
+            }
+            targets['presence_target'][sim_info['remove_indices']] = 0
+            return targets
+        if sim_info['type'] == 'wrong_sequence':
+            return {
+                'is_missing': 0,
+                'missing_positions': np.array([]),
+                'presence_target': np.ones(N, dtype=int),
+                'sequence_target': np.argsort(sim_info['shuffled_indices'])
+            }
+        return {
+            'is_mixed': 1 if len(sim_info['mixed_positions']) > 0 else 0,
+            'mixed_positions': sim_info['mixed_positions'],
+            'axis_source': sim_info['axis_source'],
+            'sequence_target': np.arange(N)
+        }
+
+    def _is_composable(self, simulations, axis):
+        """True when every step of a chain only reindexes or replaces slices along `axis`."""
+        for sim in simulations:
+            if sim['type'] in ['missing_slides', 'wrong_sequence']:
+                if sim['axis'] != axis:
+                    return False
+            elif sim['type'] == 'mixed_axis':
+                if not isinstance(sim['axis_list'], list) or list(set(sim['axis_list']))[:1] != [axis]:
+                    return False
+            else:
+                return False
+        return True
+
+    def _gather_slots(self, slot_map, replacement_slices, axis):
+        """
+        Build a volume from a slot map in one gather.
+
+        Slots below the original slice count index original slices along `axis`; the
+        remaining slots point into `replacement_slices` and are written afterwards.
+        """
+        N = self.original_shape[axis]
+        is_original = slot_map < N
+        data = self.get_slices(np.where(is_original, slot_map, 0), axis)
+        slices = np.moveaxis(data, axis, 0)
+        for pos in np.flatnonzero(~is_original):
+            slices[pos] = replacement_slices[slot_map[pos] - N]
+        return data
+
+    def _compose_chain(self, simulations, axis, variants=None, rng=None, materialize=True):
+        """
+        Run a chain along a single axis on index maps only.
+
+        Every step updates `slot_map` (which source slice ends up at each output position)
+        instead of copying the volume. All maps carry one row per variant (a single row when
+        `variants` is None) and each step draws the choices of every row in one call.
+        Returns the slot maps, the per-row replacement slices, `final_to_original` and `source_axis`.
+        """
+        N = self.original_shape[axis]
+        K = 1 if variants is None else variants
+        final_to_original = np.tile(np.arange(N), (K, 1))
+        source_axis = np.full((K, N), axis)
+        slot_map = final_to_original.copy()
+        replacement_slices = [[] for _ in range(K)]
+
+        for sim in simulations:
+            sim_type = sim['type']
+            L = slot_map.shape[1]
+            if sim_type == 'missing_slides':
+                print(f"remove_param: {sim['remove_param']}")
+                remove_indices = np.atleast_2d(self._plan_missing_slides(L, sim['remove_param'], variants, rng))
+                keep = np.ones((K, L), dtype=bool)
+                np.put_along_axis(keep, remove_indices, False, axis=1)
+                final_to_original = final_to_original[keep].reshape(K, -1)
+                source_axis = source_axis[keep].reshape(K, -1)
+                slot_map = slot_map[keep].reshape(K, -1)
+            elif sim_type == 'wrong_sequence':
+                shuffled_indices = np.atleast_2d(self._plan_wrong_sequence(L, sim['shuffle_param'], variants, rng))
+                final_to_original = np.take_along_axis(final_to_original, shuffled_indices, axis=1)
+                source_axis = np.take_along_axis(source_axis, shuffled_indices, axis=1)
+                slot_map = np.take_along_axis(slot_map, shuffled_indices, axis=1)
+            else:  # mixed_axis
+                data_shape = list(self.original_shape)
+                data_shape[axis] = L
+                _, _, axis_source, replaced = self._plan_mixed_axis(tuple(data_shape), sim['axis_list'], sim['weight_param'], variants, rng, materialize)
+                source_axis = np.atleast_2d(axis_source)
+                for v, rows in enumerate(replaced if variants is not None else [replaced]):
+                    for i, resized_slice in rows.items():
+                        slot_map[v, i] = N + len(replacement_slices[v])
+                        replacement_slices[v].append(resized_slice)
+
+        return slot_map, replacement_slices, final_to_original, source_axis
+
+    def _chain_targets(self, final_to_original, source_axis, axis, sim_types_applied):
+        """Build the chained-mode targets from the composed index maps."""
+        N = self.original_shape[axis]
+        all_original = np.arange(N)
+        targets = {
+            'final_to_original': final_to_original,
+            'source_axis': source_axis,
+        }
+        if 'missing_slides' in sim_types_applied:
+            targets['missing_original_indices'] = np.setdiff1d(all_original, final_to_original)
+            targets['presence_target'] = np.isin(all_original, final_to_original).astype(int)
+        else:
+            targets['missing_original_indices'] = np.array([])
+            targets['presence_target'] = np.ones(N, dtype=int)
+        targets['sequence_target'] = np.argsort(final_to_original) if len(final_to_original) > 0 else np.arange(N)
+        targets['mixed_positions'] = np.where(source_axis != axis)[0] if 'mixed_axis' in sim_types_applied else np.array([])
+        return targets
+
+    def _check_simulations(self, simulations, mode):
         if isinstance(simulations, dict):
             simulations = [simulations]
         elif not isinstance(simulations, list):
@@ -150,110 +659,98 @@ class ArtifactSimulator:
             raise ValueError(f"{mode.capitalize()} mode requires at least 2 simulation types")
         elif mode == "single" and len(simulations) != 1:
             raise ValueError("Single mode requires exactly 1 simulation type")
+        return simulations
+
+    def _chain_axis(self, simulations):
+        sim = simulations[0]
+        if sim['type'] in ['missing_slides', 'wrong_sequence']:
+            return sim['axis']
+        return sim['axis_list'][0]
+
+    def simulate(self, simulations, chain=False, mode="independent", save_type=None, output_path=None, rng=None,
+                 per_timepoint=False, lazy_output=False, compute_dtype=None):
+        """
+        Run `simulations` in `mode` on the original volume.
+
+        All random choices are drawn from `rng` (a `np.random.Generator`), so the same seed
+        reproduces the same outputs and targets; None draws from the global NumPy state.
+        In independent mode simulation i draws from `rng.spawn(n)[i]`.
+
+        On a 4D series the drawn slices are applied to every timepoint alike. With
+        `per_timepoint=True` (single and independent modes) each timepoint gets its own
+        draws instead and targets gain a leading timepoint dimension.
+
+        With `lazy_output=True` volumes are returned as `SimulatedVolume` views that gather
+        only the slices indexed, with the same draws and targets; chains along several axes
+        are still built in full.
+
+        `compute_dtype` overrides the simulator's compute dtype for this call only.
+        """
+        if compute_dtype is not None:
+            with self._computing_in(self._resolve_dtype(compute_dtype)):
+                return self.simulate(simulations, chain, mode, save_type, output_path, rng, per_timepoint, lazy_output)
+        simulations = self._check_simulations(simulations, mode)
+        simulate_one = self._simulate_one
+        if per_timepoint:
+            if len(self.original_shape) != 4:
+                raise ValueError("per_timepoint requires a 4D series")
+            if mode == "chained":
+                raise ValueError("per_timepoint supports single and independent modes")
+            simulate_one = self._simulate_timepoints
+        if lazy_output:
+            if per_timepoint or save_type:
+                raise ValueError("lazy_output cannot be combined with per_timepoint or save_type")
+            if mode == "independent":
+                return [self.simulate([sim], mode="single", rng=sim_rng, lazy_output=True)
+                        for sim, sim_rng in zip(simulations, _simulation_rngs(rng, mode, len(simulations)))]
+            if mode == "single" or self._is_composable(simulations, self._chain_axis(simulations)):
+                slot_map, recipes, axis, targets = self._plan_slots(simulations, mode, rng)
+                return SimulatedVolume(self, slot_map, recipes, axis), targets
 
         if mode == "single":
-            sim = simulations[0]
-            sim_type = sim['type']
-            
-            if sim_type in ['missing_slides', 'wrong_sequence']:
-                axis = sim['axis']
-            else:
-                axis = sim['axis_list'][0]
-                print(sim['axis_list'][0])
-              
-                
-            if sim_type == 'missing_slides':
-                remove_param = sim['remove_param']
-                simulated_data, sim_info = self.simulate_missing_slides(self.original_data, remove_param, axis)
-                targets = {
-                    'is_missing': 1 if len(sim_info['remove_indices']) > 0 else 0,
-                    'missing_positions': sim_info['remove_indices'],
-                    'presence_target': np.ones(self.original_shape[axis], dtype=int),
-                    'sequence_target': np.setdiff1d(np.arange(self.original_shape[axis]), sim_info['remove_indices'])
-                }
-                targets['presence_target'][sim_info['remove_indices']] = 0
-            elif sim_type == 'wrong_sequence':
-                shuffle_param = sim['shuffle_param']
-                simulated_data, sim_info = self.simulate_wrong_sequence(self.original_data, shuffle_param, axis)
-                targets = {
-                    'is_missing': 0,
-                    'missing_positions': np.array([]),
-                    'presence_target': np.ones(self.original_shape[axis], dtype=int),
-                    'sequence_target': np.argsort(sim_info['shuffled_indices'])
-                }
-            elif sim_type == 'mixed_axis':
-                axis_list = sim['axis_list']
-                weight_param = sim['weight_param']
-                simulated_data, sim_info = self.simulate_mixed_axis(self.original_data, axis_list, weight_param)
-                targets = {
-                    'is_mixed': 1 if len(sim_info['mixed_positions']) > 0 else 0,
-                    'mixed_positions': sim_info['mixed_positions'],
-                    'axis_source': sim_info['axis_source'],
-                    'sequence_target': np.arange(self.original_shape[axis])
-                }
-            else:
-                raise ValueError(f"Unknown simulation type: {sim_type}")
-
+            simulated_data, targets, axis = simulate_one(simulations[0], rng=rng)
             if save_type and output_path:
                 self.save_data(simulated_data, save_type, axis, output_path)
             return simulated_data, targets
 
         elif mode == "chained":
-            current_data = self.original_data.copy()
-            sim = simulations[0]
-            sim_type = sim['type']
-            if sim_type in ['missing_slides', 'wrong_sequence']:
-                axis = simulations[0]['axis']
-                N = self.original_shape[axis]
-                final_to_original = np.arange(N)
-                source_axis = np.full(N, axis)
+            axis = self._chain_axis(simulations)
+            N = self.original_shape[axis]
+            sim_types_applied = [sim['type'] for sim in simulations]
+
+            if self._is_composable(simulations, axis):
+                slot_map, replacement_slices, final_to_original, source_axis = self._compose_chain(simulations, axis, rng=rng)
+                current_data = self._gather_slots(slot_map[0], replacement_slices[0], axis)
+                final_to_original, source_axis = final_to_original[0], source_axis[0]
             else:
-                axis = simulations[0]['axis_list'][0]
-                N = self.original_shape['axis_list'][0]
+                # Steps along different axes cannot share one index map; apply them one by one.
+                current_data = self.original_data.astype(self.dtype, copy=False)
                 final_to_original = np.arange(N)
                 source_axis = np.full(N, axis)
-                
-            
-            
-            
-            sim_types_applied = []
 
-            for sim in simulations:
-                sim_type = sim['type']
-                sim_types_applied.append(sim_type)
-                if sim_type == 'missing_slides':
-                    remove_param = sim['remove_param']
-                    axis = sim['axis']
-                    current_data, sim_info = self.simulate_missing_slides(current_data, remove_param, axis)
-                    final_to_original = np.delete(final_to_original, sim_info['remove_indices'])
-                    source_axis = np.delete(source_axis, sim_info['remove_indices'])
-                elif sim_type == 'wrong_sequence':
-                    shuffle_param = sim['shuffle_param']
-                    axis = sim['axis']
-                    current_data, sim_info = self.simulate_wrong_sequence(current_data, shuffle_param, axis)
-                    final_to_original = final_to_original[sim_info['shuffled_indices']]
-                    source_axis = source_axis[sim_info['shuffled_indices']]
-                elif sim_type == 'mixed_axis':
-                    axis_list = sim['axis_list']
-                    weight_param = sim['weight_param']
-                    current_data, sim_info = self.simulate_mixed_axis(current_data, axis_list, weight_param)
-                    source_axis = sim_info['axis_source']
-                else:
-                    raise ValueError(f"Unknown simulation type: {sim_type}")
-
-            all_original = np.arange(N)
-            targets = {
-                'final_to_original': final_to_original,
-                'source_axis': source_axis,
-            }
-            if 'missing_slides' in sim_types_applied:
-                targets['missing_original_indices'] = np.setdiff1d(all_original, final_to_original)
-                targets['presence_target'] = np.isin(all_original, final_to_original).astype(int)
-            else:
-                targets['missing_original_indices'] = np.array([])
-                targets['presence_target'] = np.ones(N, dtype=int)
-            targets['sequence_target'] = np.argsort(final_to_original) if len(final_to_original) > 0 else np.arange(N)
-            targets['mixed_positions'] = np.where(source_axis != axis)[0] if 'mixed_axis' in sim_types_applied else np.array([])
+                for sim in simulations:
+                    sim_type = sim['type']
+                    if sim_type == 'missing_slides':
+                        remove_param = sim['remove_param']
+                        axis = sim['axis']
+                        current_data, sim_info = self.simulate_missing_slides(current_data, remove_param, axis, rng)
+                        final_to_original = np.delete(final_to_original, sim_info['remove_indices'])
+                        source_axis = np.delete(source_axis, sim_info['remove_indices'])
+                    elif sim_type == 'wrong_sequence':
+                        shuffle_param = sim['shuffle_param']
+                        axis = sim['axis']
+                        current_data, sim_info = self.simulate_wrong_sequence(current_data, shuffle_param, axis, rng)
+                        final_to_original = final_to_original[sim_info['shuffled_indices']]
+                        source_axis = source_axis[sim_info['shuffled_indices']]
+                    elif sim_type == 'mixed_axis':
+                        axis_list = sim['axis_list']
+                        weight_param = sim['weight_param']
+                        current_data, sim_info = self.simulate_mixed_axis(current_data, axis_list, weight_param, rng)
+                        source_axis = sim_info['axis_source']
+                    else:
+                        raise ValueError(f"Unknown simulation type: {sim_type}")
+
+            targets = self._chain_targets(final_to_original, source_axis, axis, sim_types_applied)
 
             if save_type and output_path:
                 self.save_data(current_data, save_type, axis, output_path)
@@ -261,45 +758,9 @@ class ArtifactSimulator:
 
         else:  # mode == "independent"
             results = []
-            for sim in simulations:
+            for sim, sim_rng in zip(simulations, _simulation_rngs(rng, mode, len(simulations))):
                 sim_type = sim['type']
-                if sim_type in ['missing_slides', 'wrong_sequence']:
-                    axis = sim['axis']
-                else:
-                    axis = sim['axis_list'][0]
-                    
-                #axis = sim['axis']
-                if sim_type == 'missing_slides':
-                    remove_param = sim['remove_param']
-                    simulated_data, sim_info = self.simulate_missing_slides(self.original_data, remove_param, axis)
-                    targets = {
-                        'is_missing': 1 if len(sim_info['remove_indices']) > 0 else 0,
-                        'missing_positions': sim_info['remove_indices'],
-                        'presence_target': np.ones(self.original_shape[axis], dtype=int),
-                        'sequence_target': np.setdiff1d(np.arange(self.original_shape[axis]), sim_info['remove_indices'])
-                    }
-                    targets['presence_target'][sim_info['remove_indices']] = 0
-                elif sim_type == 'wrong_sequence':
-                    shuffle_param = sim['shuffle_param']
-                    simulated_data, sim_info = self.simulate_wrong_sequence(self.original_data, shuffle_param, axis)
-                    targets = {
-                        'is_missing': 0,
-                        'missing_positions': np.array([]),
-                        'presence_target': np.ones(self.original_shape[axis], dtype=int),
-                        'sequence_target': np.argsort(sim_info['shuffled_indices'])
-                    }
-                elif sim_type == 'mixed_axis':
-                    axis_list = sim['axis_list']
-                    weight_param = sim['weight_param']
-                    simulated_data, sim_info = self.simulate_mixed_axis(self.original_data, axis_list, weight_param)
-                    targets = {
-                        'is_mixed': 1 if len(sim_info['mixed_positions']) > 0 else 0,
-                        'mixed_positions': sim_info['mixed_positions'],
-                        'axis_source': sim_info['axis_source'],
-                        'sequence_target': np.arange(self.original_shape[axis])
-                    }
-                else:
-                    raise ValueError(f"Unknown simulation type: {sim_type}")
+                simulated_data, targets, axis = simulate_one(sim, rng=sim_rng)
 
                 if save_type and output_path:
                     sim_output_path = f"{output_path}_{sim_type}" if output_path else f"sim_{sim_type}"
@@ -309,58 +770,239 @@ class ArtifactSimulator:
                 results.append((simulated_data, targets))
             return results
 
-    def save_data(self, data, save_type, axis, output_path=None):
+    def simulate_variants(self, simulations, variants, mode="independent", rng=None):
+        """
+        Generate `variants` independent samples from the loaded volume.
+
+        The random choices of every simulation step are drawn for all variants in one
+        vectorized call up front from `rng`, so each variant only costs its gather. Yields,
+        per variant, what `simulate` returns for `mode`.
+        """
+        simulations = self._check_simulations(simulations, mode)
+        if variants < 1:
+            raise ValueError("variants must be at least 1")
+
+        if mode == "chained":
+            axis = self._chain_axis(simulations)
+            if not self._is_composable(simulations, axis):
+                for _ in range(variants):
+                    yield self.simulate(simulations, mode="chained", rng=rng)
+                return
+            sim_types_applied = [sim['type'] for sim in simulations]
+            slot_map, replacement_slices, final_to_original, source_axis = self._compose_chain(simulations, axis, variants, rng)
+            for v in range(variants):
+                data = self._gather_slots(slot_map[v], replacement_slices[v], axis)
+                yield data, self._chain_targets(final_to_original[v], source_axis[v], axis, sim_types_applied)
+            return
+
+        rngs = _simulation_rngs(rng, mode, len(simulations))
+        infos = [self._draw_variant_infos(sim, variants, sim_rng) for sim, sim_rng in zip(simulations, rngs)]
+        for v in range(variants):
+            results = [self._simulate_one(sim, sim_infos[v])[:2] for sim, sim_infos in zip(simulations, infos)]
+            yield results[0] if mode == "single" else results
+
+    def _plan_one(self, sim, rng=None):
+        """
+        Draw one simulation on the original volume without touching voxel data.
+
+        Returns its simulation info, the output slot map along the main axis, the mixed_axis
+        replacement recipes the slots beyond the slice count point to, and that axis.
+        """
+        sim_type = sim['type']
+        if sim_type == 'missing_slides':
+            axis = sim['axis']
+            remove_indices = self._plan_missing_slides(self.original_shape[axis], sim['remove_param'], rng=rng)
+            sim_info = {'type': sim_type, 'remove_indices': remove_indices}
+        elif sim_type == 'wrong_sequence':
+            axis = sim['axis']
+            shuffled_indices = self._plan_wrong_sequence(self.original_shape[axis], sim['shuffle_param'], rng=rng)
+            sim_info = {'type': sim_type, 'shuffled_indices': shuffled_indices}
+        elif sim_type == 'mixed_axis':
+            axis, replace_indices, axis_source, replaced = self._plan_mixed_axis(
+                self.original_shape, sim['axis_list'], sim['weight_param'], rng=rng, materialize=False)
+            sim_info = {'type': sim_type, 'axis_source': axis_source, 'mixed_positions': replace_indices,
+                        'main_axis': axis, 'replaced': replaced}
+        else:
+            raise ValueError(f"Unknown simulation type: {sim_type}")
+        return (sim_info,) + self._info_slots(sim_info, axis) + (axis,)
+
+    def _info_slots(self, sim_info, axis):
+        """Slot map along `axis` and mixed_axis recipes of one drawn simulation (see `_plan_one`)."""
+        N = self.original_shape[axis]
+        if sim_info['type'] == 'missing_slides':
+            return np.delete(np.arange(N), sim_info['remove_indices']), []
+        if sim_info['type'] == 'wrong_sequence':
+            return np.asarray(sim_info['shuffled_indices']), []
+        replaced = sim_info['replaced']
+        slot_map = np.arange(N)
+        slot_map[list(replaced)] = N + np.arange(len(replaced))
+        return slot_map, list(replaced.values())
+
+    def _simulate_timepoints(self, sim, rng=None):
+        """
+        Apply one simulation to every volume of a 4D series with its own random choices.
+
+        The choices of all timepoints are drawn in one batched call and the series is built
+        in one gather. Targets get a leading timepoint dimension. Returns what `_simulate_one` does.
+        """
+        infos = self._draw_variant_infos(sim, self.original_shape[3], rng, materialize=False)
+        if sim['type'] == 'mixed_axis':
+            axis, target_axis = infos[0]['main_axis'], sim['axis_list'][0]
+        else:
+            axis = target_axis = sim['axis']
+        slots = [self._info_slots(info, axis) for info in infos]
+        data = self._gather_timepoints(np.array([slot_map for slot_map, _ in slots]), [recipes for _, recipes in slots], axis)
+        targets = [self._single_targets(info, target_axis) for info in infos]
+        return data, {key: np.stack([np.asarray(t[key]) for t in targets]) for key in targets[0]}, target_axis
+
+    def _gather_timepoints(self, slot_maps, recipes, axis):
+        """
+        Build a 4D series where timepoint t takes its slices along `axis` from slot map row t.
+
+        Slots beyond the slice count point into `recipes[t]`, resampled from volume t only.
+        """
+        N, T = self.original_shape[axis], self.original_shape[3]
+        source = self._data if self._data is not None else self._mmap
+        if source is None:
+            source = self.original_data
+        if source is self._mmap:
+            convert = self._from_mmap
+        else:
+            convert = lambda values: values.astype(self.dtype, copy=False)
+        is_original = slot_maps < N
+        # (positions, timepoints, plane) in one fancy-indexing gather
+        gathered = convert(np.moveaxis(source, axis, 0)[np.where(is_original, slot_maps, 0).T, :, :, np.arange(T)])
+
+        t_extra, pos_extra = np.nonzero(~is_original)
+        if len(t_extra):
+            recipe = np.array([recipes[t][slot_maps[t, p] - N] for t, p in zip(t_extra, pos_extra)]).reshape(-1, 2)
+            target_shape = _plane_shape(self.original_shape[:3], axis)
+            for aux_axis in np.unique(recipe[:, 0]):
+                picked = np.flatnonzero(recipe[:, 0] == aux_axis)
+                planes = convert(np.moveaxis(source, aux_axis, 0)[recipe[picked, 1], :, :, t_extra[picked]])
+                gathered[pos_extra[picked], t_extra[picked]] = self._resize_slices(planes, aux_axis, target_shape)
+        return np.moveaxis(gathered, (0, 1), (axis, 3))
+
+    def _write_slots(self, slot_map, recipes, axis, output_path, memory_budget):
+        """
+        Write the volume described by a slot map into an uncompressed NIfTI file, slab by slab.
+
+        Each slab gathers its original slices (from the memory-mapped source when lazy) and
+        resamples its mixed_axis recipes, so at most `memory_budget` bytes of slices are held.
+        """
+        out_shape = list(self.original_shape)
+        out_shape[axis] = len(slot_map)
+        out = _open_nifti_memmap(output_path, out_shape, self.dtype, self.nifti_img.affine)
+
+        largest_plane = max(int(np.prod(_plane_shape(self.original_shape, a))) for a in range(3))
+        # Gathered slab, its dtype conversion and resampling temporaries
+        itemsize = max(self.dtype.itemsize, self._resample_dtype.itemsize)
+        slab = max(1, int(memory_budget // (3 * itemsize * largest_plane)))
+        index = [slice(None)] * len(out_shape)
+        for start in range(0, len(slot_map), slab):
+            slots = slot_map[start:start + slab]
+            index[axis] = slice(start, start + len(slots))
+            out[tuple(index)] = self._gather_slab(slots, recipes, axis)
+        out.flush()
+        return out
+
+    def _gather_slab(self, slots, recipes, axis):
+        """Gather the output slices at `slots` of a slot map, resampling the mixed_axis recipes they point to."""
+        N = self.original_shape[axis]
+        is_original = slots < N
+        block = self.get_slices(np.where(is_original, slots, 0), axis)
+        extra = np.flatnonzero(~is_original)
+        if len(extra):
+            plane = _plane_shape(self.original_shape, axis)
+            np.moveaxis(block, axis, 0)[extra] = self._resample_slices([recipes[slots[i] - N] for i in extra], plane)
+        return block
+
+    def _plan_slots(self, simulations, mode, rng=None):
+        """
+        Plan a single simulation or a single-axis chain without touching voxel data.
+
+        Returns the output slot map, its mixed_axis recipes, the slot axis and the targets.
+        """
+        if mode == "single":
+            sim_info, slot_map, recipes, axis = self._plan_one(simulations[0], rng)
+            target_axis = simulations[0]['axis_list'][0] if sim_info['type'] == 'mixed_axis' else axis
+            return slot_map, recipes, axis, self._single_targets(sim_info, target_axis)
+        if mode == "chained":
+            axis = self._chain_axis(simulations)
+            if not self._is_composable(simulations, axis):
+                raise ValueError("Planned chains must run every step along the same axis")
+            slot_map, recipes, final_to_original, source_axis = self._compose_chain(simulations, axis, rng=rng, materialize=False)
+            targets = self._chain_targets(final_to_original[0], source_axis[0], axis, [sim['type'] for sim in simulations])
+            return slot_map[0], recipes[0], axis, targets
+        raise ValueError(f"Unknown simulation mode: {mode}")
+
+    def simulate_out_of_core(self, simulations, output_path, mode="single", memory_budget=256 * 2 ** 20, rng=None):
+        """
+        Run a single simulation or a single-axis chain into an uncompressed NIfTI file.
+
+        Only index maps are planned in memory; the output is then written slab by slab from
+        the source (memory-mapped with `lazy=True` on `.nii` files or through a volume cache)
+        into a memory-mapped `output_path`, holding at most `memory_budget` bytes of slices.
+        Draws and targets are identical to `simulate` with the same `rng`. Returns the output
+        memmap and the targets; in independent mode `output_path` is a list with one path per
+        simulation and a list of (memmap, targets) pairs is returned.
+        """
+        simulations = self._check_simulations(simulations, mode)
+        if mode == "independent":
+            if len(output_path) != len(simulations):
+                raise ValueError("Independent out-of-core runs need one output path per simulation")
+            rngs = _simulation_rngs(rng, mode, len(simulations))
+            return [self.simulate_out_of_core([sim], path, "single", memory_budget, sim_rng)
+                    for sim, path, sim_rng in zip(simulations, output_path, rngs)]
+        slot_map, recipes, axis, targets = self._plan_slots(simulations, mode, rng)
+        return self._write_slots(slot_map, recipes, axis, output_path, memory_budget), targets
+
+    def save_data(self, data, save_type, axis, output_path=None, snippet=False, threads=None,
+                  keep_dtype=False, compresslevel=1, compute_dtype=None):
+        """
+        Save simulated data as a 3D NIfTI file or as one JPEG per slice along `axis`.
+
+        JPEG export normalizes and rotates all slices in one vectorized pass and encodes them
+        on a pool of `threads` threads (None: one per CPU). With `snippet=True` a 2x6 montage
+        of the first 12 slices is also written as `snippet.jpg`.
+
+        NIfTI export writes the data's dtype, or the `compute_dtype` given, unless `keep_dtype`
+        is set, in which case the source's on-disk dtype, scaling and header are kept. A path
+        ending in `.gz` is gzipped at `compresslevel` on `threads` threads; any other path is
+        written uncompressed.
+        """
+        data = np.asarray(data)  # materializes a SimulatedVolume
+        if compute_dtype is not None and not keep_dtype:
+            data = _cast(data, self._resolve_dtype(compute_dtype))
         if save_type == 'jpeg':
             if output_path is None:
                 raise ValueError("output_path must be specified for JPEG saving")
+            if data.ndim != 3:
+                raise ValueError("JPEG export supports 3D volumes only")
+            import imageio  # only JPEG export needs an image encoder
+            from concurrent.futures import ThreadPoolExecutor
             os.makedirs(output_path, exist_ok=True)
-            num_slices = data.shape[axis]
-            
-            import random
-            num_slices_to_save = random.sample(range(num_slices), min(12, num_slices))
-            # num_slices_to_save = min(12, num_slices)  # Save up to 12 slices
-            
-            # Adjust the grid size to 2 rows and 6 columns
-            fig, axes = plt.subplots(2, 6, figsize=(18, 6))
-            fig.suptitle('Missing Slides  --remove_param 30', fontsize=20) #'Mixed Axis - Mixed Axial Coronal and Sagittal planes'
-            
-            for i in range(num_slices):
-                if axis == 0:
-                    slice_data = data[i, :, :]
-                elif axis == 1:
-                    slice_data = data[:, i, :]
-                elif axis == 2:
-                    slice_data = data[:, :, i]
-                min_val = slice_data.min()
-                max_val = slice_data.max()
-                if max_val > min_val:
-                    normalized = (slice_data - min_val) / (max_val - min_val) * 255
-                else:
-                    normalized = np.zeros_like(slice_data)
-                normalized = normalized.astype(np.uint8)
-                rot_data = np.rot90(normalized, k=1)
-                
-                if i <= 11:
-                    row = i // 6
-                    col = i % 6
-                    print(f"Processing slice {i}: row={row}, col={col}") 
-                    axes[row, col].imshow(rot_data, cmap='gray')
-                    axes[row, col].axis('off')
-                #axes[row, col].set_title(f'Slice {i}')
-                
-                imageio.imwrite(os.path.join(output_path, f'slice_{i:03d}.jpg'), rot_data)
-                
-            plt.tight_layout()
-            plt.subplots_adjust(top=0.9, wspace=0.01, hspace=0.01)
-            plt.savefig(os.path.join(output_path, 'snippet.jpg'))
-            plt.close()
+            frames = slices_to_uint8(data, axis)
+            num_slices = len(frames)
+
+            def write_slice(i):
+                imageio.imwrite(os.path.join(output_path, f'slice_{i:03d}.jpg'), frames[i])
+
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(write_slice, range(num_slices)))
+
+            if snippet:
+                imageio.imwrite(os.path.join(output_path, 'snippet.jpg'), montage(frames, rows=2, cols=6))
                 
             print(f"Saved {num_slices} JPEG slices to {output_path}")
         elif save_type == '3d':
             if output_path is None:
                 raise ValueError("output_path must be specified for 3D saving")
-            new_img = nib.Nifti1Image(data, self.nifti_img.affine)
-            nib.save(new_img, output_path)
+            new_img = self._source_dtype_image(data) if keep_dtype else nib.Nifti1Image(data, self.nifti_img.affine)
+            if str(output_path).endswith('.gz'):
+                _write_gzip(new_img.to_bytes(), output_path, compresslevel, threads)
+            else:
+                nib.save(new_img, output_path)
             print(f"Saved 3D NIfTI file to {output_path}")
         else:
             raise ValueError("Invalid save_type. Choose 'jpeg' or '3d'")
\ No newline at end of file
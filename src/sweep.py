@@ -0,0 +1,128 @@
+import copy
+import itertools
+import json
+from pathlib import Path
+
+import numpy as np
+
+from seeding import config_seed
+
+SWEEP_METHODS = ("grid", "lhs", "stratified")
+# Numeric parameters swept between their `<name>_lower` and `<name>_upper` bounds in param.Opts
+RANGE_PARAMS = {"missing_slides": "remove_param", "wrong_sequence": "shuffle_param", "mixed_axis": "weight_param"}
+
+
+def mixed_axis_choices(opts, axis):
+    """The mixed_axis_list values of `opts.axis_string_list` whose main axis is `axis`."""
+    return [[int(a) for a in s.split(',')] for s in opts.axis_string_list if s.startswith(str(axis))]
+
+
+def _strata(opts, sim_type):
+    """Every (axis, mixed_axis_list) combination the simulation types can use."""
+    strata = []
+    for axis in (0, 1, 2):
+        choices = mixed_axis_choices(opts, axis) if "mixed_axis" in sim_type else [None]
+        strata.extend((axis, mixed) for mixed in choices)
+    return strata
+
+
+def _config(opts, sim_mode, sim_type, axis, mixed, values):
+    config = {"sim_mode": sim_mode, "sim_type": list(sim_type), "axis": int(axis)}
+    if mixed is not None:
+        config["mixed_axis_list"] = mixed
+    for name, value in values.items():
+        config[name] = opts.int_or_float(float(value))
+    return config
+
+
+def _scale(opts, names, unit):
+    """Map unit-cube samples (n, len(names)) onto the parameters' lower-upper ranges."""
+    return [{name: getattr(opts, f"{name}_lower") + u * (getattr(opts, f"{name}_upper") - getattr(opts, f"{name}_lower"))
+             for name, u in zip(names, row)} for row in unit]
+
+
+def _latin_hypercube(n, dims, rng):
+    """`n` points in the unit cube with exactly one point in each of the n strata of every dimension."""
+    strata = rng.permuted(np.tile(np.arange(n), (dims, 1)), axis=1).T
+    return (strata + rng.random((n, dims))) / n
+
+
+def sweep_configs(opts, sim_mode, sim_type, method="grid", samples=16, levels=3, rng=None):
+    """
+    Expand the parameter ranges of `opts` (a param.Opts) into a list of simulation configs.
+
+    Only the parameters used by `sim_type` are swept: the range parameter of each type,
+    `axis`, and `mixed_axis_list` (restricted to lists starting with `axis`) for mixed_axis.
+
+    - grid: the Cartesian product of `levels` bin centres per range with every axis combination
+    - lhs: `samples` Latin-hypercube draws over the ranges and the axis choices together
+    - stratified: `samples` Latin-hypercube draws of the ranges within every axis combination
+    """
+    names = [RANGE_PARAMS[t] for t in RANGE_PARAMS if t in sim_type]
+    rng = np.random.default_rng(rng)
+    if method == "grid":
+        centres = (np.arange(levels) + 0.5) / levels  # bin centres never hit a bound such as 1.0
+        unit = np.array(list(itertools.product(centres, repeat=len(names)))).reshape(-1, len(names))
+        return [_config(opts, sim_mode, sim_type, axis, mixed, values)
+                for axis, mixed in _strata(opts, sim_type) for values in _scale(opts, names, unit)]
+    if method == "stratified":
+        configs = []
+        for axis, mixed in _strata(opts, sim_type):
+            for values in _scale(opts, names, _latin_hypercube(samples, len(names), rng)):
+                configs.append(_config(opts, sim_mode, sim_type, axis, mixed, values))
+        return configs
+    if method == "lhs":
+        # Two extra dimensions pick the axis and then one of its mixed_axis_list choices
+        unit = _latin_hypercube(samples, len(names) + 2, rng)
+        configs = []
+        for row, values in zip(unit, _scale(opts, names, unit[:, 2:])):
+            axis = int(row[0] * 3)
+            choices = mixed_axis_choices(opts, axis) if "mixed_axis" in sim_type else [None]
+            configs.append(_config(opts, sim_mode, sim_type, axis, choices[int(row[1] * len(choices))], values))
+        return configs
+    raise ValueError(f"Unknown sweep method: {method}, expected one of {SWEEP_METHODS}")
+
+
+def plan_sweep(files, configs, run_seed):
+    """
+    Build the task table of a sweep: every file paired with every config.
+
+    Tasks are grouped by file so each volume is loaded once for all of its configs. Config
+    j runs with `seeding.config_seed(run_seed, j)` as its run seed on every file.
+    """
+    seeds = [config_seed(run_seed, j) for j in range(len(configs))]
+    plan = []
+    for file_path in files:
+        for config_id, (config, seed) in enumerate(zip(configs, seeds)):
+            plan.append({"task": len(plan), "file": str(file_path), "config_id": config_id,
+                         "config": config, "seed": seed})
+    return plan
+
+
+def save_plan(plan, path):
+    """Write a plan as JSON Lines, one task per line, replacing any previous plan at `path`."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for task in plan:
+            f.write(json.dumps(task) + "\n")
+
+
+def load_plan(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def group_tasks(plan):
+    """Split a plan into `(file, tasks)` groups, in order of first appearance."""
+    groups = {}
+    for task in plan:
+        groups.setdefault(task["file"], []).append(task)
+    return list(groups.items())
+
+
+def apply_config(args, config):
+    """Copy of the run settings `args` with one task's config applied."""
+    task_args = copy.copy(args)
+    for name, value in config.items():
+        setattr(task_args, name, value)
+    return task_args
@@ -0,0 +1,119 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Targets stored as packed bitmaps (one bit per slice) instead of integer arrays
+BITMAP_TARGETS = ('presence_target',)
+
+_ALIGN = 8
+
+
+def _smallest_dtype(arr):
+    """Smallest integer dtype holding every value of an integer array."""
+    if arr.size == 0:
+        return np.dtype(np.uint8)
+    return np.result_type(np.min_scalar_type(arr.min()), np.min_scalar_type(arr.max()))
+
+
+def pack_target(name, value):
+    """Encode one target for storage: returns the array to write and its layout (shape, dtype, bitmap)."""
+    arr = np.asarray(value)
+    layout = {"shape": list(arr.shape)}
+    if name in BITMAP_TARGETS:
+        stored = np.packbits(arr.astype(bool).ravel())
+        layout["bitmap"] = True
+    elif arr.dtype.kind in "iub" or arr.size == 0:
+        stored = arr.astype(_smallest_dtype(arr))
+    else:
+        stored = arr
+    layout.update({"dtype": stored.dtype.str, "nbytes": stored.nbytes})
+    return np.ascontiguousarray(stored), layout
+
+
+def unpack_target(raw, layout):
+    """Decode a target from the uint8 bytes `raw` written for `layout`; a zero-copy view unless it is a bitmap."""
+    if layout.get("bitmap"):
+        count = int(np.prod(layout["shape"]))
+        return np.unpackbits(raw, count=count).reshape(layout["shape"]).astype(int)
+    return raw.view(np.dtype(layout["dtype"])).reshape(layout["shape"])
+
+
+class TargetsWriter:
+    """
+    Compact binary store for simulation targets, one file per run.
+
+    Each record is a run of 8-byte aligned arrays appended to `<path>`: bitmap targets are
+    packed with `np.packbits` and integer index maps use the smallest fitting dtype. The
+    array layout of every record is appended as one JSON line to `<path>.idx`, so readers
+    can memory-map the data file and slice labels out without parsing them.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.index_path = self.path + ".idx"
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._data = open(self.path, "ab")
+        self._index = open(self.index_path, "a+", encoding="utf-8")
+        self._offset = self._data.seek(0, os.SEEK_END)
+        self._index.seek(0)
+        self._records = sum(1 for _ in self._index)  # appends still go to the end in "a+" mode
+
+    def write(self, targets):
+        """Append the array-valued targets of one simulation and return a pointer to them."""
+        record = {"record": self._records, "offset": self._offset, "arrays": {}}
+        for name, value in targets.items():
+            stored, layout = pack_target(name, value)
+            layout["offset"] = self._offset
+
+            self._data.write(stored.tobytes())
+            self._offset += stored.nbytes
+            padding = -self._offset % _ALIGN
+            self._data.write(b"\0" * padding)
+            self._offset += padding
+            record["arrays"][name] = layout
+
+        self._data.flush()
+        self._index.write(json.dumps(record) + "\n")
+        self._index.flush()
+        self._records += 1
+        return {"file": os.path.basename(self.path), "record": record["record"], "offset": record["offset"]}
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class TargetsReader:
+    """
+    Read a targets file written by `TargetsWriter`.
+
+    The data file is memory-mapped once; index-map targets are returned as zero-copy
+    views into it and bitmap targets are unpacked to 0/1 arrays.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path + ".idx", encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f if line.strip()]
+        size = os.path.getsize(self.path)
+        self._mmap = np.memmap(self.path, dtype=np.uint8, mode="r") if size else np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, record, name):
+        """Return one target array of one record."""
+        layout = self.records[record]["arrays"][name]
+        return unpack_target(self._mmap[layout["offset"]:layout["offset"] + layout["nbytes"]], layout)
+
+    def __getitem__(self, record):
+        """Return all target arrays of one record as a dict."""
+        return {name: self.get(record, name) for name in self.records[record]["arrays"]}
@@ -0,0 +1,107 @@
+import base64
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+
+class VolumeCache:
+    """
+    On-disk cache of decoded NIfTI volumes.
+
+    Each entry is the decoded array saved as `<key>.npy`, which is opened
+    memory-mapped so later runs skip decompression and processes share pages through the
+    OS page cache, plus `<key>.json` holding the affine, the raw header and the source's
+    read scaling. Keys hash the source path, size and mtime (and the compute dtype unless
+    float64), so a modified source is decoded again. Entries are written atomically; once
+    the cache exceeds `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=20 * 2 ** 30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, file_path, dtype="float64"):
+        stat = os.stat(file_path)
+        source = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        if dtype != "float64":  # float64 entries keep the keys they had before compute dtypes
+            source += f"|{dtype}"
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.npy", self.cache_dir / f"{key}.json"
+
+    def get(self, file_path, dtype="float64"):
+        """Return the cached `dtype` volume of `file_path` as a NIfTI image backed by a read-only memmap, or None."""
+        data_path, meta_path = self._paths(self.key(file_path, dtype))
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            data = np.load(data_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        os.utime(data_path)  # mark as recently used
+
+        header_class = nib.Nifti2Header if meta["header_class"] == "Nifti2Header" else nib.Nifti1Header
+        image_class = nib.Nifti2Image if header_class is nib.Nifti2Header else nib.Nifti1Image
+        header = header_class.from_fileobj(io.BytesIO(base64.b64decode(meta["header"])))
+        img = image_class(data, np.array(meta["affine"]), header)
+        if "scaling" in meta:  # the image constructor resets the source's scl_slope/scl_inter
+            img.header.set_slope_inter(*meta["scaling"])
+        return img
+
+    def put(self, file_path, img, data, dtype="float64"):
+        """Store the `dtype` decode `data` of `img` loaded from `file_path`, then evict down to the size cap."""
+        key = self.key(file_path, dtype)
+        data_path, meta_path = self._paths(key)
+        meta = {
+            "source": os.path.abspath(file_path),
+            "shape": list(data.shape),
+            "affine": img.affine.tolist(),
+            "header_class": type(img.header).__name__,
+            "header": base64.b64encode(img.header.binaryblock).decode("ascii"),
+            # nibabel keeps the read scaling on the data proxy, not in the loaded header
+            "scaling": [float(getattr(img.dataobj, "slope", 1.0)), float(getattr(img.dataobj, "inter", 0.0))],
+        }
+        # Write under temporary names and rename, so readers never see partial entries.
+        suffix = f".{os.getpid()}.tmp"
+        with open(str(data_path) + suffix, "wb") as f:
+            np.save(f, data)
+        with open(str(meta_path) + suffix, "w") as f:
+            json.dump(meta, f)
+        os.replace(str(meta_path) + suffix, meta_path)
+        os.replace(str(data_path) + suffix, data_path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for data_path in self.cache_dir.glob("*.npy"):
+            meta_path = data_path.with_suffix(".json")
+            try:
+                stat = data_path.stat()
+                size = stat.st_size + (meta_path.stat().st_size if meta_path.exists() else 0)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, data_path, meta_path))
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, data_path, meta_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (data_path, meta_path):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Remove every cached volume."""
+        for path in list(self.cache_dir.glob("*.npy")) + list(self.cache_dir.glob("*.json")):
+            path.unlink()
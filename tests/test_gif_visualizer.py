@@ -0,0 +1,14 @@
+import numpy as np
+
+from gif_visualizer import slices_to_uint8
+
+
+def test_native_int16_preview_spans_full_range():
+    # Range of 60000 overflows int16 in both x - min and max - min
+    data = np.zeros((2, 4, 4), dtype=np.int16)
+    data[:, 0, 0], data[:, 1, 1], data[:, 2, 2] = -30000, 0, 30000
+    frames = slices_to_uint8(data)
+    expected = slices_to_uint8(data.astype(np.float32))
+    np.testing.assert_array_equal(frames, expected)
+    assert frames.min() == 0 and frames.max() == 255
+    assert frames[0][frames[0] > 0].min() == 127  # zero sits in the middle of the range
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+# Generous enough for slow CI machines; nibabel alone accounts for most of it
+IMPORT_BUDGET_MS = float(os.environ.get("NEUROGLITCH_IMPORT_BUDGET_MS", 1500))
+DEFERRED_MODULES = ("imageio", "matplotlib", "concurrent.futures")
+
+
+def _import_neuroglitch():
+    """Import NeuroGlitch in a fresh interpreter; return its import time in ms and the deferred modules it loaded."""
+    code = (
+        "import json, sys, time; t = time.perf_counter(); import NeuroGlitch; "
+        "elapsed = (time.perf_counter() - t) * 1000; "
+        f"print(json.dumps([elapsed, [m for m in {DEFERRED_MODULES!r} if m in sys.modules]]))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_stays_within_budget():
+    best = min(_import_neuroglitch()[0] for _ in range(3))
+    assert best <= IMPORT_BUDGET_MS, f"importing NeuroGlitch took {best:.0f} ms, budget {IMPORT_BUDGET_MS:.0f} ms"
+
+
+def test_import_defers_optional_modules():
+    _, loaded = _import_neuroglitch()
+    assert loaded == [], f"importing NeuroGlitch loaded {loaded}"
@@ -0,0 +1,31 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+from manifest import RunManifest, input_identity
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Sample_Data", "MNI152_T1_2mm_brain.nii.gz")
+
+
+def _args():
+    return SimpleNamespace(sim_mode="single", sim_type=["missing_slides"], remove_param=5, axis=0)
+
+
+def test_content_hash_keeps_identical_inputs_with_different_names_apart(tmp_path):
+    a, b = tmp_path / "a.nii.gz", tmp_path / "b.nii.gz"
+    shutil.copyfile(SAMPLE, a)
+    shutil.copyfile(SAMPLE, b)
+    with RunManifest(tmp_path / "run_manifest.jsonl") as manifest:
+        key_a = manifest.task_key(str(a), _args(), 1, content_hash=True)
+        key_b = manifest.task_key(str(b), _args(), 1, content_hash=True)
+        assert key_a != key_b
+        manifest.record(key_a, str(a), [{}], 1)
+        assert key_a in manifest and key_b not in manifest
+
+
+def test_content_hash_skips_moved_input(tmp_path):
+    moved = tmp_path / "moved"
+    moved.mkdir()
+    shutil.copyfile(SAMPLE, tmp_path / "a.nii.gz")
+    shutil.copyfile(SAMPLE, moved / "a.nii.gz")
+    assert input_identity(str(tmp_path / "a.nii.gz"), True) == input_identity(str(moved / "a.nii.gz"), True)
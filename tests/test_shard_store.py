@@ -0,0 +1,49 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from shard_store import ShardReader, ShardWriter
+from simulator import ArtifactSimulator
+
+
+@pytest.fixture
+def volume(tmp_path):
+    # Every slice along axis 0 holds its own index, so a slice names its source
+    data = np.broadcast_to(np.arange(12, dtype=np.float32)[:, None, None], (12, 8, 6)).copy()
+    path = tmp_path / "volume.nii"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+    return str(path)
+
+
+def _write(tmp_path, volume, sims, mode):
+    simulator = ArtifactSimulator(volume)
+    data, targets = simulator.simulate(sims, mode=mode, rng=np.random.default_rng(3))
+    meta = {"simulation_mode": mode, "simulation_type": sims[0]['type'],
+            "parameters": [{k: v for k, v in sim.items() if k != 'type'} for sim in sims] if mode == "chained"
+            else {k: v for k, v in sims[0].items() if k != 'type'}}
+    with ShardWriter(tmp_path / "shards", layout="slice") as writer:
+        writer.write(data, targets, meta, axis=0)
+    return ShardReader(tmp_path / "shards"), targets
+
+
+def test_chained_slice_labels_match_source_slice(tmp_path, volume):
+    sims = [{'type': 'missing_slides', 'remove_param': 3, 'axis': 0},
+            {'type': 'wrong_sequence', 'shuffle_param': 0.5, 'axis': 0}]
+    reader, targets = _write(tmp_path, volume, sims, "chained")
+    for index in range(reader.num_slices):
+        image, _, slice_targets = reader.get_slice(index)
+        assert slice_targets["final_to_original"] == image[0, 0]
+        np.testing.assert_array_equal(slice_targets["sequence_target"], targets["sequence_target"])
+
+
+def test_missing_slides_slice_labels_match_source_slice(tmp_path, volume):
+    reader, _ = _write(tmp_path, volume, [{'type': 'missing_slides', 'remove_param': 4, 'axis': 0}], "single")
+    for index in range(reader.num_slices):
+        image, _, slice_targets = reader.get_slice(index)
+        assert slice_targets["sequence_target"] == image[0, 0]
+
+
+def test_wrong_sequence_targets_stay_whole(tmp_path, volume):
+    reader, targets = _write(tmp_path, volume, [{'type': 'wrong_sequence', 'shuffle_param': 0.5, 'axis': 0}], "single")
+    _, _, slice_targets = reader.get_slice(2)
+    np.testing.assert_array_equal(slice_targets["sequence_target"], targets["sequence_target"])